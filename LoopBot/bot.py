@@ -1,4 +1,18 @@
 import os
+import sys
+
+# Single-run cron modes only need the REST API; hand off before the heavy imports below
+if __name__ == '__main__' and sys.argv[1:2] in (['daily'], ['leaderboard']):
+    from cron import main as _cron_main
+    _cron_main(sys.argv[1:2])
+    sys.exit(0)
+
+# `python bot.py profile` times startup phases and exits before logging in;
+# STARTUP_PROFILE=1 prints the same report (including login) at first on_ready
+from utils.lazy import StartupProfile, ai_trace, load, openai_client
+_PROFILE_ONLY = sys.argv[1:2] == ['profile']
+_profile = StartupProfile() if _PROFILE_ONLY or os.getenv('STARTUP_PROFILE') else None
+
 import discord
 import asyncio
 import sqlite3
@@ -9,19 +23,29 @@ from dotenv import load_dotenv
 import logging
 from datetime import datetime, time as dtime, timezone, timedelta
 
-import openai
-from openai import OpenAIError
-# Async OpenAI client for v1.x API (sync methods run via asyncio.to_thread)
-client = openai.OpenAI()
-from agents import trace
-import sys
+# openai, the agents SDK, bs4 and PIL are only needed by a few commands; they
+# load on first use via utils.lazy.load (aiohttp already comes with discord.py)
+import time
 import random
 import re
 
-from bs4 import BeautifulSoup
 import base64, csv, math
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
+
+from utils.db import Database, now_ms, run_background_migrations, to_ms
+from utils import config
+from utils.config import CHALLENGE_CHANNEL_ID, LEADERBOARD_CHANNEL_ID, VOTING_HALL_CHANNEL_ID
+from utils.backup import list_snapshots, snapshot
+from utils.xp import XPAccumulator, compact_xp_events, xp_since
+from utils import submissions
+from utils.leaderboard import VOTE_POINTS, Leaderboard, add_points, recompute_points
+from utils.search import find_submissions, parse_tag_query, search_tags
+from utils import votes
+from utils import reminders
+from utils import prompts
+
+if _profile:
+    _profile.mark('imports')
 
 # Nitter instances (fallback) for lightweight Twitter scraping
 NITTER_INSTANCES = [
@@ -49,12 +73,9 @@ load_dotenv()
 # Directory for helper scripts
 SCRIPT_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'scripts')
 TOKEN = os.getenv('DISCORD_BOT_TOKEN')
-if not TOKEN:
+if not TOKEN and not _PROFILE_ONLY:
     print("❌ ERROR: DISCORD_BOT_TOKEN environment variable is missing.")
     sys.exit(1)
-openai.api_key = os.getenv('OPENAI_API_KEY')
-# Determine if we're running in single-run mode (cron) vs. normal loop
-_RUN_MODE = sys.argv[1] if len(sys.argv) > 1 else None
 # Enable or disable the built-in scheduling (set RUN_SCHEDULE=false to rely on external cron)
 _RUN_SCHEDULE = os.getenv('RUN_SCHEDULE', 'true').lower() not in ('false', '0', 'no')
 
@@ -67,16 +88,52 @@ LEADERBOARD_MINUTE = int(os.getenv('LEADERBOARD_MINUTE', '5'))
 # Voting summary schedule (24h UTC), configurable via .env
 VOTE_SUMMARY_HOUR = int(os.getenv('VOTE_SUMMARY_HOUR', '0'))
 VOTE_SUMMARY_MINUTE = int(os.getenv('VOTE_SUMMARY_MINUTE', '0'))
+# Nightly rebuild of rankings from submissions and votes (24h UTC), ahead of the leaderboard post
+RECOMPUTE_HOUR = int(os.getenv('RECOMPUTE_HOUR', '3'))
+RECOMPUTE_MINUTE = int(os.getenv('RECOMPUTE_MINUTE', '30'))
 # Crypto price update interval in hours (default: every hour)
 CRYPTO_INTERVAL_HOURS = int(os.getenv('CRYPTO_INTERVAL_HOURS', '1'))
 # Voting lock window (hours) after submission; votes outside this window are ignored
 VOTE_WINDOW_HOURS = int(os.getenv('VOTE_WINDOW_HOURS', '24'))
+# Post each batch of closed-window results (votes and points earned) in the voting hall
+VOTE_RESULTS_POST = os.getenv('VOTE_RESULTS_POST', 'false').lower() in ('true', '1', 'yes')
 # Live crypto update interval in seconds for livecrypto scrolling ticker; override via CRYPTO_LIVE_INTERVAL env var
 CRYPTO_LIVE_INTERVAL = int(os.getenv('CRYPTO_LIVE_INTERVAL', '20'))
 # Optional role IDs to assign upon reaching certain levels
 XP_ROLE_L3 = int(os.getenv('XP_ROLE_L3', '0')) or None
 XP_ROLE_L5 = int(os.getenv('XP_ROLE_L5', '0')) or None
 XP_ROLE_L10 = int(os.getenv('XP_ROLE_L10', '0')) or None
+# XP write-behind: flush buffered awards every XP_FLUSH_MS or once XP_FLUSH_EVENTS are pending
+XP_FLUSH_MS = int(os.getenv('XP_FLUSH_MS', '2000'))
+XP_FLUSH_EVENTS = int(os.getenv('XP_FLUSH_EVENTS', '500'))
+# Reaction votes are coalesced in memory and written in one transaction every VOTE_FLUSH_MS
+VOTE_FLUSH_MS = int(os.getenv('VOTE_FLUSH_MS', '1000'))
+# Re-sync stored quick votes with actual reactions on open submissions every
+# VOTE_RECONCILE_MINUTES (0 disables), fetching at most VOTE_RECONCILE_CONCURRENCY messages at once
+VOTE_RECONCILE_MINUTES = int(os.getenv('VOTE_RECONCILE_MINUTES', '30'))
+VOTE_RECONCILE_CONCURRENCY = int(os.getenv('VOTE_RECONCILE_CONCURRENCY', '4'))
+# Daily DM reminders: concurrent sends and request starts per second
+REMINDER_CONCURRENCY = int(os.getenv('REMINDER_CONCURRENCY', '5'))
+REMINDER_RATE = float(os.getenv('REMINDER_RATE', '5'))
+# Keep PROMPT_BUFFER_SIZE AI prompts pre-generated; top up at these UTC hours (off-peak)
+PROMPT_BUFFER_SIZE = int(os.getenv('PROMPT_BUFFER_SIZE', '7'))
+PROMPT_REFILL_HOURS = [
+    int(h) for h in os.getenv('PROMPT_REFILL_HOURS', '2,14').split(',') if h.strip()
+]
+# Max users whose XP state and cooldown are kept in memory (least recently active evicted first)
+XP_COOLDOWN_CACHE = int(os.getenv('XP_COOLDOWN_CACHE', '50000'))
+# Raw xp_events older than this are pruned once rolled into daily totals; compaction runs every XP_COMPACT_HOURS
+XP_RETENTION_DAYS = int(os.getenv('XP_RETENTION_DAYS', '30'))
+XP_COMPACT_HOURS = int(os.getenv('XP_COMPACT_HOURS', '6'))
+# SQLite tuning: page cache and memory map per connection (MB), WAL checkpoint interval,
+# and WAL size (pages) past which a checkpoint also truncates the file
+DB_CACHE_MB = int(os.getenv('DB_CACHE_MB', '16'))
+DB_MMAP_MB = int(os.getenv('DB_MMAP_MB', '64'))
+DB_CHECKPOINT_SECONDS = int(os.getenv('DB_CHECKPOINT_SECONDS', '60'))
+DB_WAL_TRUNCATE_PAGES = int(os.getenv('DB_WAL_TRUNCATE_PAGES', '4000'))
+# Online compressed DB snapshots every BACKUP_HOURS (0 disables), keeping the newest BACKUP_KEEP
+BACKUP_HOURS = int(os.getenv('BACKUP_HOURS', '6'))
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
 
 # Intents
 intents = discord.Intents.default()
@@ -84,7 +141,26 @@ intents.message_content = True
 intents.members = True
 
 # Bot initialization
-bot = commands.Bot(command_prefix='!', intents=intents)
+class LoopBot(commands.Bot):
+    async def setup_hook(self):
+        # Made here, on the loop the bot runs on: Python 3.9 binds locks at creation.
+        # Held while a reminder dispatch runs so a resume and the daily run never overlap
+        self.reminders_running = asyncio.Lock()
+
+    async def close(self):
+        # Persist buffered XP before the connection goes away
+        try:
+            await xp_buffer.flush()
+        except Exception as e:
+            print(f"⚠️ Failed to flush XP on shutdown: {e}")
+        try:
+            await vote_queue.flush()
+        except Exception as e:
+            print(f"⚠️ Failed to flush votes on shutdown: {e}")
+        await super().close()
+
+
+bot = LoopBot(command_prefix='!', intents=intents)
 
 # Channel and category IDs (update with your server's IDs)
 # Central ID table:
@@ -98,7 +174,7 @@ bot = commands.Bot(command_prefix='!', intents=intents)
 # Daily Loop category: 1393808136133148692
 # current-challenge: 1393808509463691294
 # submissions: 1393808617354035321
-VOTING_HALL_CHANNEL_ID = 1393808682407428127 # voting-hall
+# voting-hall: 1393808682407428127
 # Creative Zone category: 1393809063665467402
 # visual-art: 1393809187531919360
 # beat-loops: 1393809294079819917
@@ -126,10 +202,8 @@ MUSIC_SHARE_CHANNEL_ID = 1393811741715988540  # music-share
 RULES_CHANNEL_ID = 1396655144804024380
 MODERATOR_ONLY_CHANNEL_ID = 1396655144804024383
 VOICE_CATEGORY_ID = 1394026685975887993
-CHALLENGE_CHANNEL_ID = 1393808509463691294  # current-challenge
+# CHALLENGE_/VOTING_HALL_/LEADERBOARD_CHANNEL_ID come from utils.config (cron.py posts there too)
 SUBMISSIONS_CHANNEL_ID = 1393808617354035321 # submissions
-VOTING_HALL_CHANNEL_ID = 1393808682407428127 # voting-hall
-LEADERBOARD_CHANNEL_ID = 1393810922396585984 # leaderboard
 CRYPTO_CHANNEL_ID = 1401992445251817472      # crypto price tracker (embed updates)
 CRYPTO_VOICE_CATEGORY_ID = int(os.getenv('CRYPTO_VOICE_CATEGORY_ID', '0')) or None  # crypto voice category for live tickers
 WELCOME_CHANNEL_ID = 1393807671525773322     # welcome
@@ -140,14 +214,7 @@ MEMES_CHANNEL_ID = 1393811645922545745       # memes-and-vibes
 ## SQLite DB setup
 ## Persistent storage detection: prefer env var, else auto‑detect mounted /data or LoopBot/data
 # Persistent storage detection: env var or mounted /data, else fallback to LoopBot/data
-_env_data = os.getenv('RAILWAY_PERSISTENT_DIR') or os.getenv('DATA_DIR')
-_vol_data = '/data' if os.path.isdir('/data') else None
-_local_data = (
-    os.path.join(os.getcwd(), 'LoopBot', 'data')
-    if os.path.isdir(os.path.join(os.getcwd(), 'LoopBot', 'data'))
-    else None
-)
-persistent_dir = _env_data or _vol_data or _local_data
+persistent_dir = config.persistent_dir()
 # Debug: verify which directory is used for persistence
 print(f"🔍 Persistent dir is: {persistent_dir}")
 if persistent_dir and os.path.isdir(persistent_dir):
@@ -185,170 +252,105 @@ else:
 
 # Ensure parent directory exists before opening the SQLite database
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-conn = sqlite3.connect(DB_PATH)
-c = conn.cursor()
-c.execute('''CREATE TABLE IF NOT EXISTS rankings (
-    user_id TEXT PRIMARY KEY,
-    points INTEGER
-)''')
-conn.commit()
-
-# Create submissions and votes tables (include tags/orig_message_id/timestamp columns)
-c.execute('''CREATE TABLE IF NOT EXISTS audio_submissions (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id TEXT,
-    filename TEXT,
-    timestamp TEXT,
-    thread_id INTEGER,
-    message_id INTEGER,
-    orig_message_id INTEGER,
-    tags TEXT
-)''')
-c.execute('''CREATE TABLE IF NOT EXISTS link_submissions (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id TEXT,
-    link TEXT,
-    timestamp TEXT,
-    tags TEXT,
-    thread_id INTEGER,
-    message_id INTEGER,
-    orig_message_id INTEGER
-)''')
-c.execute('''CREATE TABLE IF NOT EXISTS votes (
-    user_id TEXT,
-    submission_id INTEGER,
-    score INTEGER,
-    timestamp TEXT,
-    PRIMARY KEY(user_id, submission_id)
-)''')
-conn.commit()
-
-## XP & leveling tables
-c.execute('''CREATE TABLE IF NOT EXISTS users (
-    user_id TEXT PRIMARY KEY,
-    xp INTEGER DEFAULT 0,
-    level INTEGER DEFAULT 0,
-    last_xp_ts TEXT
-)''')
-c.execute('''CREATE TABLE IF NOT EXISTS xp_events (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id TEXT,
-    delta INTEGER,
-    reason TEXT,
-    ts TEXT
-)''')
-
-## Streak tracking table
-c.execute('''CREATE TABLE IF NOT EXISTS streaks (
-    user_id TEXT PRIMARY KEY,
-    current INTEGER DEFAULT 0,
-    best INTEGER DEFAULT 0,
-    last_date TEXT
-)''')
-
-## Optional DM reminders opt-in
-c.execute('''CREATE TABLE IF NOT EXISTS reminders (
-    user_id TEXT PRIMARY KEY
-)''')
-conn.commit()
-
-# Migrate existing tables to add missing columns if needed
-try:
-    c.execute('ALTER TABLE audio_submissions ADD COLUMN tags TEXT')
-    c.execute('ALTER TABLE audio_submissions ADD COLUMN orig_message_id INTEGER')
-    c.execute('ALTER TABLE link_submissions ADD COLUMN tags TEXT')
-    c.execute('ALTER TABLE link_submissions ADD COLUMN orig_message_id INTEGER')
-    c.execute('ALTER TABLE votes ADD COLUMN timestamp TEXT')
-    conn.commit()
-except sqlite3.OperationalError:
-    pass
-
-# Messages & voting v2 tables
-c.execute('''CREATE TABLE IF NOT EXISTS messages (
-    message_id INTEGER PRIMARY KEY,
-    channel_id INTEGER,
-    author_id TEXT,
-    timestamp TEXT
-)''')
-c.execute('''CREATE TABLE IF NOT EXISTS message_votes (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    message_id INTEGER,
-    voter_id TEXT,
-    score INTEGER,
-    ts TEXT,
-    UNIQUE(message_id, voter_id)
-)''')
-conn.commit()
+# Snapshots live next to the database on the persistent volume unless BACKUP_DIR is set
+BACKUP_DIR = os.getenv('BACKUP_DIR') or os.path.join(persistent_dir or os.path.dirname(DB_PATH), 'backups')
+# All handlers go through the async data layer (writer thread + small read pool)
+db = Database(
+    DB_PATH,
+    readers=int(os.getenv('DB_READ_POOL', '2')),
+    cache_mb=DB_CACHE_MB,
+    mmap_mb=DB_MMAP_MB,
+)
+if _profile:
+    _profile.mark('config')
+db.setup()
+if _profile:
+    _profile.mark('database')
+xp_buffer = XPAccumulator(db, max_events=XP_FLUSH_EVENTS, max_users=XP_COOLDOWN_CACHE)
+# Message ids of submissions whose voting window is still open (loaded in on_ready)
+vote_windows = submissions.VoteWindowCache(VOTE_WINDOW_HOURS)
+# Pending reaction votes, flushed by flush_votes
+vote_queue = votes.VoteQueue(db)
+# Sorted in-memory mirror of rankings for top-N reads (loaded in on_ready)
+points_board = Leaderboard()
 
 # Static fallback prompts (shuffled to vary order)
-_fallback_prompts = [
-    "🌿 Create a loop inspired by nature's rhythm.",
-    "💭 Make something based on a dream you had.",
-    "🚀 Design a sound/scene/story from the future.",
-    "🌀 Loop based on the feeling of déjà vu.",
-    "🔥 Create something chaotic, messy, raw."
-]
+_fallback_prompts = list(prompts.FALLBACK_PROMPTS)
 random.shuffle(_fallback_prompts)
 static_prompts = itertools.cycle(_fallback_prompts)
 
-# Generate a prompt using GPT
-async def generate_ai_prompt():
+# Unified prompt fetcher: instant pop from the pre-generated buffer, static fallback if it ran dry
+async def get_prompt():
+    prompt = await db.transaction(prompts.pop_prompt)
+    if prompt is None:
+        print("⚠️ Prompt buffer empty; using a fallback prompt.")
+        return next(static_prompts)
+    return prompt
+
+async def refill_prompt_buffer():
+    """Top the prompt buffer up to PROMPT_BUFFER_SIZE with freshly generated prompts."""
     try:
-        data = await asyncio.to_thread(
-            client.chat.completions.create,
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": (
-                    "You are a creative challenge bot. Provide concise, vivid, and self-contained prompts "
-                    "in complete sentences that inspire music, art, or storytelling."
-                )},
-                {"role": "user", "content": (
-                    "Please give me a creative challenge prompt: one or two clear, vivid sentences."
-                )}
-            ],
-            max_tokens=100,
-            temperature=0.7,
-            frequency_penalty=0.5,
-            presence_penalty=0.0,
-        )
-        return data.choices[0].message.content.strip()
+        added = await prompts.refill(db, prompts.generate_ai_prompt, PROMPT_BUFFER_SIZE)
     except Exception as e:
-        print(f"[❌] OpenAI error: {e}")
-        return next(static_prompts)
+        print(f"⚠️ Prompt buffer refill failed: {e}")
+        return
+    if added:
+        print(f"🧠 Prompt buffer: generated {added} prompt(s)")
 
-# Unified prompt fetcher
-async def get_prompt():
-    return await generate_ai_prompt()
+# Off-peak refills; tasks.loop rejects an empty time list, so no loop when PROMPT_REFILL_HOURS is empty
+refill_prompts = tasks.loop(
+    time=[dtime(hour=h, minute=0, tzinfo=timezone.utc) for h in PROMPT_REFILL_HOURS]
+)(refill_prompt_buffer) if PROMPT_REFILL_HOURS else None
 
 # On bot startup
 @bot.event
 async def on_ready():
     print(f"🤑 Logged in as: {bot.user}")
-    # If invoked in single-run mode via cron, perform that action once and exit
-    if _RUN_MODE == 'daily':
-        channel = bot.get_channel(CHALLENGE_CHANNEL_ID)
-        if channel:
-            prompt = await get_prompt()
-            await channel.send(f"🎯 **Daily Challenge**:\n{prompt}")
-        await bot.close()
-        return
-
-    if _RUN_MODE == 'leaderboard':
-        channel = bot.get_channel(LEADERBOARD_CHANNEL_ID)
-        if channel:
-            c.execute(
-                "SELECT user_id, points FROM rankings ORDER BY points DESC LIMIT 5"
-            )
-            top = c.fetchall()
-            text = "🏆 **Top 5 Creators:**\n" + "\n".join(
-                [f"{i+1}. <@{user}> – {pts} pts" for i, (user, pts) in enumerate(top)]
-            )
-            await channel.send(text)
-        await bot.close()
-        return
+    global _profile
+    if _profile:
+        _profile.mark('login')
+        print(_profile.report())
+        _profile = None
+    # Exclude the bot user from every leaderboard
+    if not points_board.loaded:
+        points_board.exclude(bot.user.id)
+        await points_board.load(db)
+    # Write-behind XP flushing runs regardless of scheduling
+    if not flush_xp.is_running():
+        await xp_buffer.warm_cooldowns(now_ms())
+        flush_xp.start()
+    if not compact_xp.is_running():
+        compact_xp.start()
+    if not recompute_rankings.is_running():
+        recompute_rankings.start()
+    if not checkpoint_db.is_running():
+        checkpoint_db.start()
+    if refill_prompts and not refill_prompts.is_running():
+        refill_prompts.start()
+        # Don't wait for the first off-peak slot if the buffer is already short
+        if (await prompts.buffer_status(db))['depth'] < PROMPT_BUFFER_SIZE:
+            bot.loop.create_task(refill_prompt_buffer())
+    if BACKUP_HOURS and not backup_db.is_running():
+        backup_db.start()
+    # Hot cache of submissions still open for voting
+    await vote_windows.load(db)
+    if not flush_votes.is_running():
+        flush_votes.start()
+    if not close_vote_windows.is_running():
+        close_vote_windows.start()
+    # Catch up on reactions made while offline, then keep re-syncing
+    if VOTE_RECONCILE_MINUTES and not reconcile_votes.is_running():
+        reconcile_votes.start()
+    # Resumable backfills queued by schema migrations
+    if not background_migrations.is_running():
+        background_migrations.start()
 
     # Normal operation: start the daily challenge loop if scheduling is enabled
     if _RUN_SCHEDULE:
+        # Finish a reminder run that a restart cut short
+        state = await reminders.progress(db, datetime.now(timezone.utc).date().isoformat())
+        if state['after'] and not state['done']:
+            bot.loop.create_task(send_reminders())
         try:
             post_daily_challenge.start()
             post_daily_leaderboard.start()
@@ -362,24 +364,160 @@ async def on_ready():
             "🕒 Automatic scheduling disabled (RUN_SCHEDULE=false); skipping daily loop startup."
         )
 
+@tasks.loop(seconds=XP_FLUSH_MS / 1000)
+async def flush_xp():
+    """Write buffered XP awards and events to the database in one transaction."""
+    try:
+        await xp_buffer.flush()
+    except Exception as e:
+        print(f"⚠️ XP flush failed (will retry): {e}")
+
+@tasks.loop(hours=XP_COMPACT_HOURS)
+async def compact_xp():
+    """Roll xp_events into daily totals, prune old raw rows and reclaim free pages."""
+    try:
+        rolled, pruned, free_pages = await compact_xp_events(db, XP_RETENTION_DAYS)
+        print(f"🧹 XP compaction: rolled {rolled}, pruned {pruned}, {free_pages} free pages left")
+    except Exception as e:
+        print(f"⚠️ XP compaction failed: {e}")
+
+@tasks.loop(time=dtime(hour=RECOMPUTE_HOUR, minute=RECOMPUTE_MINUTE, tzinfo=timezone.utc))
+async def recompute_rankings():
+    """Re-derive every user's points from submissions and votes and fix any drift."""
+    try:
+        checked, corrected = await recompute_points(db)
+        if corrected:
+            await points_board.load(db)
+        print(f"🧮 Rankings recompute: {checked} users checked, {corrected} corrected")
+    except Exception as e:
+        print(f"⚠️ Rankings recompute failed: {e}")
+
+@tasks.loop(seconds=DB_CHECKPOINT_SECONDS)
+async def checkpoint_db():
+    """Copy committed WAL pages into the database file outside the write path."""
+    try:
+        busy, wal_pages, copied = await db.checkpoint('PASSIVE')
+        # Everything is copied back; reset a large WAL so it doesn't keep its size on disk
+        if not busy and wal_pages >= DB_WAL_TRUNCATE_PAGES and copied == wal_pages:
+            await db.checkpoint('TRUNCATE')
+    except Exception as e:
+        print(f"⚠️ WAL checkpoint failed: {e}")
+
+@tasks.loop(hours=max(BACKUP_HOURS, 1))
+async def backup_db():
+    """Take a rotated, compressed online snapshot of the database."""
+    try:
+        path, size, secs = await snapshot(db, BACKUP_DIR, BACKUP_KEEP)
+        print(f"💾 Snapshot {os.path.basename(path)}: {size / 1024:.0f} KiB in {secs:.1f}s")
+    except Exception as e:
+        print(f"⚠️ Database snapshot failed: {e}")
+
+@backup_db.before_loop
+async def before_backup_db():
+    # Keep the cadence across restarts: wait out what is left since the newest snapshot
+    existing = list_snapshots(BACKUP_DIR)
+    if existing:
+        age = time.time() - os.path.getmtime(existing[-1])
+        await asyncio.sleep(max(0, BACKUP_HOURS * 3600 - age))
+
+@tasks.loop(seconds=VOTE_FLUSH_MS / 1000)
+async def flush_votes():
+    """Write coalesced reaction votes to the database in one transaction."""
+    try:
+        await vote_queue.flush()
+    except Exception as e:
+        print(f"⚠️ Vote flush failed (will retry): {e}")
+
+@tasks.loop(minutes=1)
+async def close_vote_windows():
+    """Close voting windows as they expire and settle their vote points into rankings."""
+    # The cache's heap knows the next deadline; wake for it instead of up to a minute late
+    closes = vote_windows.next_close()
+    if closes is not None and closes - time.time() < 60:
+        await asyncio.sleep(max(0, closes - time.time()))
+    vote_windows.evict()
+    # Settlement works off the database, so windows that closed while offline catch up here
+    try:
+        # Votes cast just before the close may still be queued
+        await vote_queue.flush()
+        results, totals = await votes.settle_closed(db, VOTE_WINDOW_HOURS)
+    except Exception as e:
+        print(f"⚠️ Vote settlement failed (will retry): {e}")
+        return
+    for uid, pts in totals.items():
+        points_board.set(uid, pts)
+    if results and VOTE_RESULTS_POST:
+        await post_vote_results(results)
+
+async def fetch_quick_voters(message_id: int, channel_id: int):
+    """Ids of non-bot users with a quick-vote reaction on a message, or None if it can't be fetched."""
+    channel = bot.get_channel(channel_id)
+    if channel is None:
+        return None
+    try:
+        msg = await channel.fetch_message(message_id)
+        voters = set()
+        for reaction in msg.reactions:
+            if str(reaction.emoji) in QUICK_VOTE_EMOJIS:
+                async for user in reaction.users():
+                    if not user.bot:
+                        voters.add(user.id)
+        return voters
+    except discord.NotFound:
+        return None
+    except discord.HTTPException as e:
+        print(f"⚠️ Could not fetch reactions for {message_id}: {e}")
+        return None
+
+@tasks.loop(minutes=max(1, VOTE_RECONCILE_MINUTES))
+async def reconcile_votes():
+    """Bring stored quick votes in line with the reactions on submissions still open for voting."""
+    try:
+        checked, added, removed = await votes.reconcile(
+            db, fetch_quick_voters, VOTE_WINDOW_HOURS,
+            VOTING_HALL_CHANNEL_ID, (SUBMISSIONS_CHANNEL_ID, VOTING_HALL_CHANNEL_ID),
+            concurrency=VOTE_RECONCILE_CONCURRENCY, queue=vote_queue,
+        )
+    except Exception as e:
+        print(f"⚠️ Vote reconciliation failed (will resume): {e}")
+        return
+    if added or removed:
+        print(f"🔁 Vote reconciliation: {checked} messages, +{added} / -{removed} votes")
+
+async def post_vote_results(results, limit: int = 10):
+    """Announce the final tallies of just-closed submissions in the voting hall."""
+    channel = bot.get_channel(VOTING_HALL_CHANNEL_ID)
+    if not channel:
+        return
+    ranked = sorted((r for r in results if r[2] is not None), key=lambda r: r[5], reverse=True)
+    if not ranked:
+        return
+    lines = [
+        f"{i}. <@{author}> – {n} 👍 (+{n * VOTE_POINTS} pts) "
+        f"https://discord.com/channels/{channel.guild.id}/{channel_id or VOTING_HALL_CHANNEL_ID}/{msg_id}"
+        for i, (_, _, author, msg_id, channel_id, n, _) in enumerate(ranked[:limit], start=1)
+    ]
+    if len(ranked) > limit:
+        lines.append(f"…and {len(ranked) - limit} more.")
+    try:
+        await channel.send("🏁 **Voting closed:**\n" + "\n".join(lines))
+    except Exception as e:
+        print(f"⚠️ Failed to post vote results: {e}")
+
+@tasks.loop(count=1)
+async def background_migrations():
+    """Drain background data migrations in small batches (resumes after a restart)."""
+    try:
+        await run_background_migrations(db)
+    except Exception as e:
+        print(f"⚠️ Background migration failed (will resume on next start): {e}")
+
 ## Scheduled posts
 @tasks.loop(time=dtime(hour=DAILY_HOUR, minute=DAILY_MINUTE, tzinfo=timezone.utc))
 async def post_daily_challenge():
     """Post the daily creative prompt at the configured time."""
     channel = bot.get_channel(CHALLENGE_CHANNEL_ID)
     if channel:
-        # Send DM reminders to opted-in users before the daily challenge
-        c.execute("SELECT user_id FROM reminders")
-        for (uid,) in c.fetchall():
-            user = bot.get_user(int(uid))
-            if user:
-                try:
-                    await user.send(
-                        "🔔 Reminder: don't forget to submit today's creative challenge!"
-                    )
-                except Exception:
-                    pass
-
         prompt = await get_prompt()
         # Post daily prompt as an embed for richer formatting
         embed = discord.Embed(
@@ -394,20 +532,48 @@ async def post_daily_challenge():
         await channel.send(embed=embed)
     else:
         print("⚠️ Challenge channel not found. Check CHALLENGE_CHANNEL_ID.")
+    # DM reminders fan out in the background so they never hold up the post
+    bot.loop.create_task(send_reminders())
+
+async def _send_reminder(user_id: int):
+    """DM one subscriber; map Discord errors to a dispatch outcome."""
+    try:
+        user = bot.get_user(user_id) or await bot.fetch_user(user_id)
+        await user.send("🔔 Reminder: don't forget to submit today's creative challenge!")
+        return reminders.SENT
+    except discord.Forbidden:
+        # DMs closed or no shared server
+        return reminders.BLOCKED
+    except discord.HTTPException as e:
+        if e.status == 429:
+            raise reminders.RateLimited(float(e.response.headers.get('Retry-After', 5)))
+        return reminders.FAILED
+
+async def send_reminders():
+    """Deliver today's DM reminders, resuming a run interrupted by a restart."""
+    if bot.reminders_running.locked():
+        return
+    async with bot.reminders_running:
+        day = datetime.now(timezone.utc).date().isoformat()
+        try:
+            state = await reminders.dispatch(
+                db, _send_reminder, day, concurrency=REMINDER_CONCURRENCY, rate=REMINDER_RATE,
+            )
+        except Exception as e:
+            print(f"⚠️ Reminder dispatch stopped (will resume): {e}")
+            return
+        print(
+            f"📬 Reminders for {day}: {state['sent']} sent, "
+            f"{state['failed']} failed, {state['blocked']} blocked"
+        )
 
 @tasks.loop(time=dtime(hour=LEADERBOARD_HOUR, minute=LEADERBOARD_MINUTE, tzinfo=timezone.utc))
 async def post_daily_leaderboard():
     """Post the daily top-5 leaderboard at the configured UTC time."""
     channel = bot.get_channel(LEADERBOARD_CHANNEL_ID)
     if channel:
-        # Exclude the bot user from the leaderboard
-        bot_id = str(bot.user.id)
-        c.execute(
-            "SELECT user_id, points FROM rankings WHERE user_id != ? "
-            "ORDER BY points DESC LIMIT 5",
-            (bot_id,)
-        )
-        top = c.fetchall()
+        # Bot user is excluded by the leaderboard index itself
+        top = points_board.top(5)
         if top:
             embed = discord.Embed(
                 title="🏆 Top 5 Creators:",
@@ -431,43 +597,48 @@ async def post_vote_summary():
     """Post a daily summary of top-voted submissions in the voting-hall channel."""
     channel = bot.get_channel(VOTING_HALL_CHANNEL_ID)
     if channel:
-        # Trending = votes cast in the last VOTE_WINDOW_HOURS
-        since = datetime.now(timezone.utc) - timedelta(hours=VOTE_WINDOW_HOURS)
-        threshold = since.isoformat()
-        c.execute(
-            "SELECT message_id, SUM(score) AS total FROM message_votes "
-            "WHERE ts >= ? GROUP BY message_id "
-            "ORDER BY total DESC LIMIT 5",
-            (threshold,)
-        )
-        rows = c.fetchall()
+        # Trending = votes cast in the last VOTE_WINDOW_HOURS (summed from hourly buckets)
+        rows = await votes.trending(db, VOTE_WINDOW_HOURS, 5)
         if not rows:
             await channel.send("🏅 No votes have been cast in the recent window.")
             return
-        # Send one embed per top submission so image and vote count are clear
-        for i, (msg_id, total) in enumerate(rows, start=1):
-            try:
-                msg = await channel.fetch_message(msg_id)
-            except Exception:
-                msg = None
-            title = f"#{i}"
-            color = discord.Color.green() if total > 0 else discord.Color.red()
-
-            embed = discord.Embed(
-                title=f"🏅 Trending {title}",
-                color=color,
-            )
-            # Include vote count
-            embed.add_field(name="Total Votes", value=str(total), inline=True)
-            # If there's an image attached, show it; otherwise link to submission
-            if msg and msg.attachments:
-                embed.set_image(url=msg.attachments[0].url)
-            elif msg:
-                embed.add_field(name="Link", value=f"[View Submission]({msg.jump_url})", inline=True)
-            await channel.send(embed=embed)
+        # Everything comes from submission_media; only expired CDN URLs cost a fetch
+        media = await submissions.media_for(db, [msg_id for msg_id, _, _ in rows])
+        await refresh_media(media)
+        embeds = votes.summary_embeds(rows, media, channel.guild.id, VOTING_HALL_CHANNEL_ID)
+        await channel.send(embeds=[discord.Embed.from_dict(e) for e in embeds])
     else:
         print("⚠️ Voting hall channel not found. Check VOTING_HALL_CHANNEL_ID.")
 
+def media_of(msg):
+    """submission_media row for a message: its jump URL and first attachment, if any."""
+    att = msg.attachments[0] if msg.attachments else None
+    return (
+        msg.id, msg.channel.id, msg.jump_url,
+        att and att.url, att and att.content_type, att and att.size,
+    )
+
+async def refresh_media(media: dict, concurrency: int = 3):
+    """Re-fetch messages whose cached attachment URL has expired and update ``media`` and the DB."""
+    # URLs about to expire count as expired so the posted embeds still load
+    stale = submissions.stale_media(media)
+    if not stale:
+        return
+    sem = asyncio.Semaphore(concurrency)
+
+    async def fetch(msg_id, channel_id):
+        async with sem:
+            try:
+                msg = await bot.get_channel(channel_id).fetch_message(msg_id)
+            except Exception as e:
+                print(f"⚠️ Could not refresh attachment URL for {msg_id}: {e}")
+                return None
+            return (msg_id, msg.attachments[0].url) if msg.attachments else None
+
+    fresh = [r for r in await asyncio.gather(*(fetch(*s) for s in stale)) if r]
+    if fresh:
+        await db.transaction(submissions.refresh_media_urls, fresh)
+    submissions.apply_fresh_urls(media, fresh)
 
 
 @tasks.loop(
@@ -621,6 +792,7 @@ async def livecrypto(ctx):
 
     # Helper to build PNG card for a coin
     def build_card(coin: dict) -> BytesIO:
+        Image, ImageDraw, ImageFont = (load(f'PIL.{m}') for m in ('Image', 'ImageDraw', 'ImageFont'))
         symbol = coin.get('symbol', '').upper()
         price = coin.get('current_price') or 0
         change24 = coin.get('price_change_percentage_24h') or 0
@@ -696,56 +868,46 @@ async def livecrypto(ctx):
     bot.loop.create_task(updater())
 
 
-# XP & leveling: accrue XP on messages (1 XP per 60s), track levels, assign roles
+# The one message handler: raw submission records, XP, commands, then passive submissions
 @bot.event
 async def on_message(message):
     # Record any new submission (attachments) in the submissions channel
     if message.channel.id == SUBMISSIONS_CHANNEL_ID and message.attachments and not message.author.bot:
         try:
-            c.execute(
-                "INSERT OR IGNORE INTO messages(message_id, channel_id, author_id, timestamp) VALUES(?,?,?,?)",
-                (
-                    message.id,
-                    message.channel.id,
-                    str(message.author.id),
-                    message.created_at.replace(tzinfo=timezone.utc).isoformat(),
-                ),
+            created_ms = to_ms(message.created_at)
+            await db.transaction(
+                submissions.record_message,
+                message.id,
+                message.channel.id,
+                message.author.id,
+                created_ms,
+                [media_of(message)],
             )
-            conn.commit()
+            vote_windows.add(message.id, created_ms)
         except Exception as e:
             print(f"⚠️ Failed to record submission message: {e}")
 
-    # Ignore bots and blacklisted channels for XP & voting logic
+    # Ignore bots entirely; no XP in blacklisted channels
     if message.author.bot:
         return
-    if message.channel.id in (RULES_CHANNEL_ID, MODERATOR_ONLY_CHANNEL_ID):
-        return
-    now = datetime.now(timezone.utc)
-    user_id = str(message.author.id)
-    # Fetch or initialize user record
-    c.execute("SELECT xp, level, last_xp_ts FROM users WHERE user_id = ?", (user_id,))
-    row = c.fetchone()
-    if row:
-        xp, lvl, last_ts = row
-        last_ts = datetime.fromisoformat(last_ts) if last_ts else None
-    else:
-        xp, lvl, last_ts = 0, 0, None
-    # Award XP if last award was over 60 seconds ago
-    if last_ts is None or (now - last_ts).total_seconds() >= 60:
-        new_xp = xp + 1
-        new_lvl = int(0.1 * math.sqrt(new_xp))
-        # Upsert user XP and level
-        c.execute(
-            "INSERT INTO users(user_id, xp, level, last_xp_ts) VALUES(?,?,?,?) "
-            "ON CONFLICT(user_id) DO UPDATE SET xp=excluded.xp, level=excluded.level, last_xp_ts=excluded.last_xp_ts",
-            (user_id, new_xp, new_lvl, now.isoformat()),
-        )
-        # Record event
-        c.execute(
-            "INSERT INTO xp_events(user_id, delta, reason, ts) VALUES(?,?,?,?)",
-            (user_id, 1, "message", now.isoformat()),
-        )
-        conn.commit()
+    if message.channel.id not in (RULES_CHANNEL_ID, MODERATOR_ONLY_CHANNEL_ID):
+        await award_message_xp(message)
+    # Process commands first (so !submit still works)
+    await bot.process_commands(message)
+    if (
+        message.channel.id == SUBMISSIONS_CHANNEL_ID
+        and not message.content.startswith(bot.command_prefix)
+    ):
+        await passive_submission(message)
+
+
+# XP & leveling: accrue XP on messages (1 XP per 60s), track levels, assign roles
+async def award_message_xp(message):
+    # Award XP if last award was over 60 seconds ago (cooldown checked in memory;
+    # writes are buffered and persisted by flush_xp)
+    awarded = await xp_buffer.award(message.author.id, now_ms())
+    if awarded:
+        lvl, new_lvl = awarded
         # Assign level-up role if configured
         if new_lvl > lvl:
             try:
@@ -762,8 +924,6 @@ async def on_message(message):
                         await message.author.add_roles(role, reason="Level up")
             except Exception as e:
                 print(f"⚠️ Failed to assign level role: {e}")
-    # Continue with other commands and events
-    await bot.process_commands(message)
 
 # Commands
 @bot.command()
@@ -771,14 +931,21 @@ async def ping(ctx):
     await ctx.send("🏓 Pong!")
 
 
+@bot.command(name='xp')
+async def xp_cmd(ctx):
+    """Show your XP, level and XP gained over the last 7 days."""
+    xp, lvl = await xp_buffer.stats(ctx.author.id)
+    week = await xp_since(db, ctx.author.id, datetime.now(timezone.utc) - timedelta(days=7))
+    await ctx.send(f"✨ {ctx.author.mention}: {xp} XP (level {lvl}), +{week} XP this week.")
+
+
 @bot.command()
 async def streak(ctx):
     """Show your current and best daily submission streak."""
-    user_id = str(ctx.author.id)
-    c.execute(
+    user_id = ctx.author.id
+    row = await db.fetchone(
         "SELECT current, best FROM streaks WHERE user_id = ?", (user_id,)
     )
-    row = c.fetchone()
     if not row:
         await ctx.send("🔸 You have no recorded streak yet. Submit something to start your streak!")
         return
@@ -789,10 +956,9 @@ async def streak(ctx):
 @bot.command()
 async def streakboard(ctx):
     """Show top current streaks among all users."""
-    c.execute(
+    rows = await db.fetchall(
         "SELECT user_id, current, best FROM streaks ORDER BY current DESC LIMIT 5"
     )
-    rows = c.fetchall()
     if not rows:
         await ctx.send("🔸 No streaks recorded yet.")
         return
@@ -805,81 +971,48 @@ async def streakboard(ctx):
 @bot.command()
 async def remindme(ctx):
     """Opt in to receive a daily DM reminder to submit the challenge."""
-    user_id = str(ctx.author.id)
-    c.execute("SELECT 1 FROM reminders WHERE user_id = ?", (user_id,))
-    if c.fetchone():
-        c.execute("DELETE FROM reminders WHERE user_id = ?", (user_id,))
-        conn.commit()
+    user_id = ctx.author.id
+    if await db.fetchone("SELECT 1 FROM reminders WHERE user_id = ?", (user_id,)):
+        await db.execute("DELETE FROM reminders WHERE user_id = ?", (user_id,))
         await ctx.send("🔕 You have been unsubscribed from daily reminders.")
     else:
-        c.execute("INSERT INTO reminders(user_id) VALUES(?)", (user_id,))
-        conn.commit()
+        await db.execute("INSERT INTO reminders(user_id) VALUES(?)", (user_id,))
         await ctx.send("🔔 You are now subscribed to daily reminders.")
 
 
+# Quick votes: 👍 or ⭐ on submissions or on voting-hall messages
+QUICK_VOTE_EMOJIS = ("👍", "⭐")
+
+def _quick_vote(payload) -> bool:
+    """True if a raw reaction event is a quick vote on a submission with an open window."""
+    return (
+        payload.user_id != bot.user.id
+        and payload.channel_id in (SUBMISSIONS_CHANNEL_ID, VOTING_HALL_CHANNEL_ID)
+        and str(payload.emoji) in QUICK_VOTE_EMOJIS
+        # Closed windows are settled; their votes are final
+        and vote_windows.is_open(payload.message_id)
+    )
+
+
 @bot.event
-async def on_reaction_add(reaction, user):
-    """Quick vote via 👍 or ⭐ reactions on submissions or on voting-hall messages."""
-    if user.bot:
-        return
-    msg = reaction.message
-    if msg.channel.id not in (SUBMISSIONS_CHANNEL_ID, VOTING_HALL_CHANNEL_ID):
-        return
-    if str(reaction.emoji) not in ("👍", "⭐"):
-        return
-    # Determine original submission timestamp from messages or submissions tables
-    c.execute("SELECT timestamp FROM messages WHERE message_id = ?", (msg.id,))
-    row = c.fetchone()
-    if not row:
-        c.execute(
-            "SELECT timestamp FROM audio_submissions WHERE message_id = ?",
-            (msg.id,),
-        )
-        row = c.fetchone()
-    if not row:
-        c.execute(
-            "SELECT timestamp FROM link_submissions WHERE message_id = ?",
-            (msg.id,),
-        )
-        row = c.fetchone()
-    if not row:
-        return
-    msg_ts = datetime.fromisoformat(row[0])
-    if (datetime.now(timezone.utc) - msg_ts).total_seconds() > VOTE_WINDOW_HOURS * 3600:
+async def on_raw_reaction_add(payload):
+    """Queue a quick vote; raw events also fire for messages outside the client's cache."""
+    if payload.member and payload.member.bot:
         return
-    try:
-        c.execute(
-            "INSERT INTO message_votes(message_id, voter_id, score, ts) VALUES(?,?,?,?)",
-            (msg.id, str(user.id), 1, datetime.now(timezone.utc).isoformat()),
-        )
-        conn.commit()
-    except sqlite3.IntegrityError:
-        pass
+    if _quick_vote(payload):
+        vote_queue.add(payload.message_id, payload.user_id, now_ms())
 
 
 @bot.event
-async def on_reaction_remove(reaction, user):
-    """Remove quick-vote if a 👍 or ⭐ reaction is removed."""
-    if user.bot:
-        return
-    msg = reaction.message
-    if msg.channel.id not in (SUBMISSIONS_CHANNEL_ID, VOTING_HALL_CHANNEL_ID):
-        return
-    if str(reaction.emoji) not in ("👍", "⭐"):
-        return
-    try:
-        c.execute(
-            "DELETE FROM message_votes WHERE message_id = ? AND voter_id = ? AND score = 1",
-            (msg.id, str(user.id)),
-        )
-        conn.commit()
-    except Exception:
-        pass
+async def on_raw_reaction_remove(payload):
+    """Queue removal of a quick vote when its 👍 or ⭐ reaction is taken back."""
+    if _quick_vote(payload):
+        vote_queue.remove(payload.message_id, payload.user_id)
 
 @bot.command(name='commands')
 async def list_commands(ctx):
     await ctx.send(
-        "📜 Commands: `!ping`, `!how`, `!submit <link>` or attach a file, `!vote <1-10>`, `!rank`, `!leaderboard`, `!chat <msg>`, `!search #tag`, `!music [track|album|artist] <search terms>`, `!gif <search terms>`"
+        "📜 Commands: `!ping`, `!how`, `!submit <link>` or attach a file, `!vote <1-10>`, `!rank`, `!nearme`, `!leaderboard`, `!trending [hours]`, `!chat <msg>`, `!search #tag`, `!find <words>`, `!music [track|album|artist] <search terms>`, `!gif <search terms>`"
     )
 
 @bot.command(name='how')
@@ -889,7 +1022,7 @@ async def how(ctx):
         "👋 **How to use LoopBot:**\n"
         "1. Each morning, check the daily challenge in the designated channel or with `!postprompt`.\n"
         "2. Create your work and submit it with `!submit <link>` or attach a file (audio/image/video/other).\n"
-        "3. Earn 1 point per submission and bonus points for 👍 reactions.\n"
+        "3. Earn 1 point per submission and a bonus point for every 👍 or vote from others once voting closes.\n"
         "4. View your score with `!rank` and the top creators with `!leaderboard`.\n"
         "5. Administrators can manually post a prompt using `!postprompt`.\n"
         "6. Use `!ping` to check if I'm alive!"
@@ -943,29 +1076,34 @@ async def submit(ctx, link: str = None):
     await sent.add_reaction("👍")
     await sent.add_reaction("👎")
 
+    uid = ctx.author.id
+    now = now_ms()
+    media = [media_of(sent), media_of(ctx.message)]
     if attachments:
-        c.execute(
-            "INSERT INTO audio_submissions (user_id, filename, timestamp, orig_message_id, tags, message_id) VALUES (?, ?, ?, ?, ?, ?)",
-            (uid, attachments[0].filename, now_iso, ctx.message.id, tags, sent.id),
+        await db.transaction(
+            submissions.add_submission, submissions.KIND_AUDIO,
+            uid, attachments[0].filename, now, tags, ctx.message.id, sent.id, media,
         )
     else:
-        c.execute(
-            "INSERT INTO link_submissions (user_id, link, timestamp, tags, orig_message_id, message_id) VALUES (?, ?, ?, ?, ?, ?)",
-            (uid, link, now_iso, tags, ctx.message.id, sent.id),
+        await db.transaction(
+            submissions.add_submission, submissions.KIND_LINK,
+            uid, link, now, tags, ctx.message.id, sent.id, media,
         )
-    conn.commit()
+    vote_windows.add(sent.id, now)
+    vote_windows.add(ctx.message.id, now)
+    # Award 1 submission point
+    points_board.set(uid, await db.transaction(add_points, uid, 1))
 
     await ctx.send(
         f"✅ Submission posted in {voting_chan.mention}. Voting is now open."
     )
 
     # --- Streak update: one submission per day increments streak ---
-    user_id = str(ctx.author.id)
+    user_id = ctx.author.id
     today = datetime.now(timezone.utc).date().isoformat()
-    c.execute(
+    row = await db.fetchone(
         "SELECT current, best, last_date FROM streaks WHERE user_id = ?", (user_id,)
     )
-    row = c.fetchone()
     if row:
         current, best, last_date = row
         if last_date != today:
@@ -975,39 +1113,55 @@ async def submit(ctx, link: str = None):
             else:
                 current = 1
             best = max(best, current)
-            c.execute(
+            await db.execute(
                 "UPDATE streaks SET current = ?, best = ?, last_date = ? WHERE user_id = ?",
                 (current, best, today, user_id),
             )
     else:
         current, best = 1, 1
-        c.execute(
+        await db.execute(
             "INSERT INTO streaks(user_id, current, best, last_date) VALUES(?,?,?,?)",
             (user_id, current, best, today),
         )
-    conn.commit()
 
 @bot.command()
 async def rank(ctx):
-    user_id = str(ctx.author.id)
-    result = c.execute("SELECT points FROM rankings WHERE user_id = ?", (user_id,)).fetchone()
-    points = result[0] if result else 0
-    await ctx.send(f"📊 {ctx.author.mention}, you have **{points}** points.")
+    """Show your points, leaderboard position, percentile and gap to the next creator."""
+    user_id = ctx.author.id
+    pos = points_board.position(user_id)
+    if not pos:
+        return await ctx.send(f"📊 {ctx.author.mention}, you have **0** points.")
+    position, total, points = pos
+    text = (
+        f"📊 {ctx.author.mention}, you have **{points}** points "
+        f"— #{position} of {total} (top {math.ceil(100 * position / total)}%)."
+    )
+    above = points_board.next_above(user_id)
+    if above:
+        text += f"\n⬆️ {above[1] - points} pts behind <@{above[0]}>."
+    await ctx.send(text)
 
 @bot.command()
-async def leaderboard(ctx):
-    """Show the top 5 creators by points."""
-    # Exclude the bot user from the public leaderboard
-    bot_id = str(bot.user.id)
-    c.execute(
-        "SELECT user_id, points FROM rankings WHERE user_id != ? "
-        "ORDER BY points DESC LIMIT 5",
-        (bot_id,)
-    )
-    top = c.fetchall()
+async def nearme(ctx):
+    """Show the creators ranked just above and below you."""
+    rows = points_board.around(ctx.author.id, radius=2)
+    if not rows:
+        return await ctx.send("📊 You're not on the leaderboard yet. Submit something to get ranked!")
+    me = ctx.author.id
+    lines = [
+        f"{'➡️ ' if uid == me else ''}{i}. <@{uid}> – {pts} pts" for i, uid, pts in rows
+    ]
+    await ctx.send("📊 **Creators near you:**\n" + "\n".join(lines))
+
+@bot.command()
+async def leaderboard(ctx, n: int = 5):
+    """Show the top creators by points (default 5, max 25). Usage: `!leaderboard [n]`"""
+    n = max(1, min(n, 25))
+    # Bot user is excluded by the leaderboard index itself
+    top = points_board.top(n)
     if not top:
         return await ctx.send("🏆 No submissions yet; no leaderboard available.")
-    text = "🏆 **Top 5 Creators:**\n" + "\n".join(
+    text = f"🏆 **Top {n} Creators:**\n" + "\n".join(
         [f"{i+1}. <@{user}> – {pts} pts" for i, (user, pts) in enumerate(top)]
     )
     await ctx.send(text)
@@ -1021,38 +1175,33 @@ async def vote(ctx, score: int = None):
     if not ref or not ref.message_id:
         return await ctx.send("❌ Please reply to a submission message to cast your vote.")
     msg_id = ref.message_id
-    # Lookup submission timestamp: allow submissions or forwarded messages
-    c.execute("SELECT timestamp FROM messages WHERE message_id = ?", (msg_id,))
-    row = c.fetchone()
-    if not row:
-        c.execute(
-            "SELECT timestamp FROM audio_submissions WHERE message_id = ?", (msg_id,)
-        )
-        row = c.fetchone()
-    if not row:
-        c.execute(
-            "SELECT timestamp FROM link_submissions WHERE message_id = ?", (msg_id,)
-        )
-        row = c.fetchone()
-    if not row:
-        return await ctx.send("❌ That message is not recognized as a submission.")
-    # Enforce voting window
-    msg_ts = datetime.fromisoformat(row[0])
-    if (datetime.now(timezone.utc) - msg_ts).total_seconds() > VOTE_WINDOW_HOURS * 3600:
+    # Enforce voting window from the hot cache; only hit the registry to explain a rejection
+    if not vote_windows.is_open(msg_id):
+        if not await submissions.lookup(db, msg_id):
+            return await ctx.send("❌ That message is not recognized as a submission.")
         return await ctx.send("❌ Voting period has closed for that submission.")
     # Record vote (unique per user+message)
-    voter_id = str(ctx.author.id)
-    now_iso = datetime.now(timezone.utc).isoformat()
+    voter_id = ctx.author.id
     try:
-        c.execute(
-            "INSERT INTO message_votes(message_id, voter_id, score, ts) VALUES(?,?,?,?)",
-            (msg_id, voter_id, score, now_iso),
-        )
-        conn.commit()
+        await db.transaction(votes.add_vote, msg_id, voter_id, score, now_ms())
         await ctx.send(f"✅ Your vote of {score} has been recorded.")
     except sqlite3.IntegrityError:
         await ctx.send("❌ You have already voted on this submission.")
 
+@bot.command(name='trending')
+async def trending(ctx, hours: int = None):
+    """Show the top-voted submissions over the last N hours. Usage: `!trending [hours]`"""
+    hours = max(1, min(hours or VOTE_WINDOW_HOURS, 24 * 30))
+    rows = await votes.trending(db, hours, 5)
+    if not rows:
+        return await ctx.send(f"🏅 No votes in the last {hours}h.")
+    guild_id = ctx.guild.id if ctx.guild else '@me'
+    lines = [
+        f"{i}. {total} votes – https://discord.com/channels/{guild_id}/{channel_id or VOTING_HALL_CHANNEL_ID}/{msg_id}"
+        for i, (msg_id, total, channel_id) in enumerate(rows, start=1)
+    ]
+    await ctx.send(f"🏅 **Trending (last {hours}h):**\n" + "\n".join(lines))
+
 @bot.command()
 @commands.has_permissions(administrator=True)
 async def postprompt(ctx):
@@ -1076,6 +1225,49 @@ async def postprompt_error(ctx, error):
     else:
         raise error
 
+@bot.command(name='snapshot')
+@commands.has_permissions(administrator=True)
+async def snapshot_cmd(ctx):
+    """Take an online database snapshot now and report its size and duration."""
+    msg = await ctx.send("💾 Taking database snapshot…")
+    try:
+        path, size, secs = await snapshot(db, BACKUP_DIR, BACKUP_KEEP)
+    except Exception as e:
+        print(f"⚠️ Manual snapshot failed: {e}")
+        return await msg.edit(content=f"❌ Snapshot failed: {e}")
+    await msg.edit(
+        content=f"✅ Snapshot `{os.path.basename(path)}`: {size / 1024:.0f} KiB in {secs:.2f}s "
+        f"(keeping the newest {BACKUP_KEEP})."
+    )
+
+@snapshot_cmd.error
+async def snapshot_error(ctx, error):
+    if isinstance(error, commands.MissingPermissions):
+        await ctx.send("❌ You need Administrator permissions to use this command.")
+    else:
+        raise error
+
+@bot.command(name='promptbuffer')
+@commands.has_permissions(administrator=True)
+async def promptbuffer(ctx):
+    """Show how many AI prompts are ready and how the last refill went."""
+    status = await prompts.buffer_status(db)
+    text = f"🧠 Prompt buffer: {status['depth']}/{PROMPT_BUFFER_SIZE} ready."
+    if status.get('at'):
+        at = datetime.fromtimestamp(status['at'] / 1000, tz=timezone.utc)
+        text += (
+            f" Last refill {at:%Y-%m-%d %H:%M} UTC: +{status['added']} in {status['seconds']:.1f}s"
+            + ("" if status['ok'] else " (stopped on a generation error)")
+        )
+    await ctx.send(text)
+
+@promptbuffer.error
+async def promptbuffer_error(ctx, error):
+    if isinstance(error, commands.MissingPermissions):
+        await ctx.send("❌ You need Administrator permissions to use this command.")
+    else:
+        raise error
+
 @bot.command(name='postrules')
 @commands.has_permissions(administrator=True)
 async def postrules(ctx):
@@ -1095,31 +1287,51 @@ async def postrules(ctx):
     await ctx.send(f"✅ Community guidelines posted in {rules_chan.mention}.")
 
 @bot.command(name='search')
-async def search(ctx, tag: str = None):
-    """Search past submissions by #tag."""
-    if not tag:
+async def search(ctx, *, query: str = None):
+    """Search past submissions by #tag. Usage: `!search #a #b` (all), `#a or #b` (any), `#beat*` (prefix)."""
+    terms, mode, cursor = parse_tag_query((query or '').split())
+    if not terms:
         return await ctx.send("❌ Please specify a tag to search, e.g. `!search #music`." )
-    tag_clean = tag.lstrip('#')
+    label = f" {mode.upper()} ".join(f"#{t}{'*' if p else ''}" for t, p in terms)
+    rows, next_cursor = await search_tags(db, terms, mode, cursor)
+    if not rows:
+        return await ctx.send(f"🔍 No submissions found tagged {label}.")
     results = []
-    # link submissions
-    c.execute(
-        "SELECT user_id, link, timestamp FROM link_submissions WHERE tags LIKE ?",
-        (f"%{tag_clean}%",)
-    )
-    for user_id, link, ts in c.fetchall():
-        results.append(f"🔗 {link} by <@{user_id}> at {ts}")
-    # file submissions
-    c.execute(
-        "SELECT user_id, filename, timestamp FROM audio_submissions WHERE tags LIKE ?",
-        (f"%{tag_clean}%",)
-    )
-    for user_id, filename, ts in c.fetchall():
-        results.append(f"📁 {filename} by <@{user_id}> at {ts}")
-    if not results:
-        return await ctx.send(f"🔍 No submissions found tagged #{tag_clean}.")
-    # limit output
-    out = results[:10]
-    await ctx.send(f"🔍 Search results for #{tag_clean}:\n" + "\n".join(out))
+    for kind, _, ts, user_id, content in rows:
+        icon = "📁" if kind == submissions.KIND_AUDIO else "🔗"
+        results.append(f"{icon} {content} by <@{user_id}> at <t:{ts // 1000}:f>")
+    text = f"🔍 Search results for {label}:\n" + "\n".join(results)
+    if next_cursor:
+        text += f"\n➡️ More: `!search {query.replace(f'next:{cursor}', '').strip()} next:{next_cursor}`"
+    await ctx.send(text)
+
+@bot.command(name='find')
+async def find(ctx, *, query: str = None):
+    """Full-text search of submission links, text and filenames. Usage: `!find <words> [page:N]`"""
+    words, page = [], 1
+    for w in (query or '').split():
+        if w.lower().startswith('page:') and w[5:].isdigit():
+            page = int(w[5:])
+        else:
+            words.append(w)
+    text = ' '.join(words)
+    if not text:
+        return await ctx.send("❌ Please provide search words, e.g. `!find rainy lofi`.")
+    try:
+        rows, more = await find_submissions(db, text, page)
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ !find failed: {e}")
+        return await ctx.send("⚠️ Full-text search is unavailable right now.")
+    if not rows:
+        return await ctx.send(f"🔍 No submissions found matching '{text}'.")
+    results = []
+    for kind, _, user_id, content, ts in rows:
+        icon = "📁" if kind == submissions.KIND_AUDIO else "🔗"
+        results.append(f"{icon} {content} by <@{user_id}> at <t:{ts // 1000}:f>")
+    out = f"🔍 Results for '{text}' (page {page}):\n" + "\n".join(results)
+    if more:
+        out += f"\n➡️ More: `!find {text} page:{page + 1}`"
+    await ctx.send(out)
 
 @bot.command(name='memes')
 async def memes(ctx):
@@ -1146,7 +1358,7 @@ async def memes(ctx):
         return await ctx.send(
             "⚠️ Unable to fetch memes right now. Please try again later."
         )
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = load('bs4').BeautifulSoup(html, 'html.parser')
     # Nitter attachments use <img class="attachment-image" src="/...">
     imgs = soup.find_all('img', class_='attachment-image')
     seen = set()
@@ -1208,7 +1420,7 @@ async def scrape(ctx):
             except Exception:
                 continue
 
-            soup = BeautifulSoup(html, "html.parser")
+            soup = load('bs4').BeautifulSoup(html, "html.parser")
             for img in soup.find_all("img", class_="attachment-image"):
                 src = img.get("src", "")
                 if not src:
@@ -1334,20 +1546,21 @@ async def chat(ctx, *, prompt: str = None):
     # Debug: log the outgoing prompt
     print(f"[AI DEBUG] Prompt: {prompt}")
     try:
-        resp = await asyncio.to_thread(
-            client.chat.completions.create,
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful AI assistant."},
-                {"role": "user", "content": prompt},
-            ],
-            max_tokens=150,
-            temperature=0.7,
-        )
+        with ai_trace():
+            resp = await asyncio.to_thread(
+                openai_client().chat.completions.create,
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": "You are a helpful AI assistant."},
+                    {"role": "user", "content": prompt},
+                ],
+                max_tokens=150,
+                temperature=0.7,
+            )
         reply = resp.choices[0].message.content.strip()
         await ctx.send(reply)
         print(f"[AI DEBUG] Reply: {reply}")
-    except OpenAIError as e:
+    except load('openai').OpenAIError as e:
         err_msg = str(e)
         await ctx.send(f"⚠️ AI request failed: {err_msg}")
         print(f"[AI ERROR] OpenAIError: {err_msg}")
@@ -1400,20 +1613,9 @@ async def on_member_join(member):
 
 
 # Allow raw file or link posts in submissions channel as submissions
-@bot.event
-async def on_message(message):
+async def passive_submission(message):
     """Allow raw file or link posts in submissions channel as submissions."""
-    # Process commands first (so !submit still works)
-    await bot.process_commands(message)
-    # Ignore bots and non-submissions channels or prefixed commands
-    if (
-        message.author.bot
-        or message.channel.id != SUBMISSIONS_CHANNEL_ID
-        or message.content.startswith(bot.command_prefix)
-    ):
-        return
-
-    uid = str(message.author.id)
+    uid = message.author.id
     # Attachment submission (auto-create thread and record)
     if message.attachments:
         # Add vote reactions (thumbs-up/thumbs-down) to the original message for attachments
@@ -1421,22 +1623,17 @@ async def on_message(message):
         await message.add_reaction("👎")
         print(f"📸 Passive submission by {message.author} | MsgID: {message.id}")
         att = message.attachments[0]
-        now_iso = datetime.now(timezone.utc).isoformat()
+        now = now_ms()
         # Record submission metadata (tags + original message for reply-votes)
         tag_list = [w.lstrip('#') for w in message.content.split() if w.startswith('#')]
         tags = ' '.join(tag_list)
-        c.execute(
-            "INSERT INTO audio_submissions (user_id, filename, timestamp, orig_message_id, tags) VALUES (?, ?, ?, ?, ?)",
-            (uid, att.filename, now_iso, message.id, tags)
+        sub_id = await db.transaction(
+            submissions.add_submission, submissions.KIND_AUDIO,
+            uid, att.filename, now, tags, message.id, None, [media_of(message)],
         )
-        sub_id = c.lastrowid
-        conn.commit()
+        vote_windows.add(message.id, now)
         # Award 1 submission point
-        c.execute(
-            "INSERT OR REPLACE INTO rankings (user_id, points) VALUES (?, COALESCE((SELECT points FROM rankings WHERE user_id = ?), 0) + ?)",
-            (uid, uid, 1)
-        )
-        conn.commit()
+        points_board.set(uid, await db.transaction(add_points, uid, 1))
         # Post; no immediate points, voting only
         chan = bot.get_channel(VOTING_HALL_CHANNEL_ID)
         content = f"📥 **File Submission from {message.author.mention}:**"
@@ -1447,17 +1644,17 @@ async def on_message(message):
         await sent.add_reaction("👍")
         await sent.add_reaction("👎")
         # Only record message ID for voting
-        c.execute(
-            "UPDATE audio_submissions SET message_id = ? WHERE id = ?",
-            (sent.id, sub_id)
+        await db.transaction(
+            submissions.set_message_id, submissions.KIND_AUDIO, sub_id, sent.id, now,
+            [media_of(sent)],
         )
-        conn.commit()
-    await chan.send("✅ Submission accepted! Voting is now open.")
+        vote_windows.add(sent.id, now)
+        await chan.send("✅ Submission accepted! Voting is now open.")
 
     # Link submission (record tags + original message)
     raw = message.content.strip()
     if raw:
-        now_iso = datetime.now(timezone.utc).isoformat()
+        now = now_ms()
         words = raw.split()
         # extract tags (e.g. #tag)
         tag_list = [w.lstrip('#') for w in words if w.startswith('#')]
@@ -1469,18 +1666,13 @@ async def on_message(message):
         else:
             body = ' '.join(w for w in words if not w.startswith('#'))
         # record submission
-        c.execute(
-            "INSERT INTO link_submissions (user_id, link, timestamp, tags, orig_message_id) VALUES (?, ?, ?, ?, ?)",
-            (uid, body, now_iso, tags, message.id)
+        sub_id = await db.transaction(
+            submissions.add_submission, submissions.KIND_LINK,
+            uid, body, now, tags, message.id, None, [media_of(message)],
         )
-        sub_id = c.lastrowid
-        conn.commit()
+        vote_windows.add(message.id, now)
         # Award 1 submission point
-        c.execute(
-            "INSERT OR REPLACE INTO rankings (user_id, points) VALUES (?, COALESCE((SELECT points FROM rankings WHERE user_id = ?), 0) + ?)",
-            (uid, uid, 1)
-        )
-        conn.commit()
+        points_board.set(uid, await db.transaction(add_points, uid, 1))
         chan = bot.get_channel(VOTING_HALL_CHANNEL_ID)
         # post full body text
         content = f"📥 **Link Submission from {message.author.mention}:** {body}"
@@ -1491,11 +1683,11 @@ async def on_message(message):
         await sent.add_reaction("👍")
         await sent.add_reaction("👎")
         # record message ID for voting
-        c.execute(
-            "UPDATE link_submissions SET message_id = ? WHERE id = ?",
-            (sent.id, sub_id)
+        await db.transaction(
+            submissions.set_message_id, submissions.KIND_LINK, sub_id, sent.id, now,
+            [media_of(sent)],
         )
-        conn.commit()
+        vote_windows.add(sent.id, now)
         # Confirm submission; voting via reactions only
         await chan.send("✅ Submission accepted! Voting is now open.")
 
@@ -1507,5 +1699,21 @@ async def on_command_error(ctx, error):
         return
     raise error
 
-with trace("LoopBot"):
-    bot.run(TOKEN)
+async def _profile_caches():
+    """Load the startup caches on_ready builds, for `python bot.py profile`."""
+    await points_board.load(db)
+    await vote_windows.load(db)
+    await xp_buffer.warm_cooldowns(now_ms())
+
+if _PROFILE_ONLY:
+    _profile.mark('handlers')
+    asyncio.run(_profile_caches())
+    _profile.mark('caches')
+    print(_profile.report())
+    db.close()
+    sys.exit(0)
+if _profile:
+    _profile.mark('handlers')
+
+bot.run(TOKEN)
+db.close()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Single-run LoopBot jobs for external schedulers (cron, Railway cron).
+
+  python cron.py daily          post today's challenge prompt from the prompt buffer, then top it up
+  python cron.py leaderboard    post the top-5 leaderboard
+  python cron.py vote-summary   post the trending submissions summary
+  python cron.py streak-reset   zero current streaks that missed a day
+  python cron.py backup         write a compressed database snapshot
+
+Like post_welcome.py this talks to the Discord REST API only: no gateway
+login, no member chunking and none of the bot's heavy imports, so a run
+takes a few HTTP calls. ``python bot.py daily|leaderboard`` forwards here.
+--db defaults to DB_PATH or the same persistent-volume lookup as bot.py
+(``utils.config.default_db_path``).
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+from utils import prompts, submissions, votes
+from utils.backup import snapshot
+from utils.config import CHALLENGE_CHANNEL_ID, LEADERBOARD_CHANNEL_ID, VOTING_HALL_CHANNEL_ID, default_db_path
+from utils.db import Database
+
+API = "https://discord.com/api/v10"
+
+JOBS = ('daily', 'leaderboard', 'vote-summary', 'streak-reset', 'backup')
+
+
+def bot_user_id(token: str):
+    """The bot's user id, which is the base64 first segment of its token."""
+    try:
+        head = token.split('.')[0]
+        return int(base64.b64decode(head + '=' * (-len(head) % 4)))
+    except ValueError:
+        return None
+
+
+class Rest:
+    """Minimal Discord REST client on one aiohttp session."""
+
+    def __init__(self, token: str):
+        # Only the posting jobs need an HTTP client
+        import aiohttp
+
+        self.session = aiohttp.ClientSession(headers={"Authorization": f"Bot {token}"})
+
+    async def request(self, method: str, path: str, **kwargs):
+        for _ in range(3):
+            async with self.session.request(method, API + path, **kwargs) as resp:
+                if resp.status == 429:
+                    await asyncio.sleep((await resp.json()).get('retry_after', 1))
+                    continue
+                if resp.status >= 400:
+                    raise RuntimeError(f"{method} {path} failed ({resp.status}): {await resp.text()}")
+                return await resp.json() if resp.status != 204 else None
+        raise RuntimeError(f"{method} {path} still rate limited")
+
+    async def send(self, channel_id: int, content: str = None, embeds=None):
+        payload = {'content': content} if content else {}
+        if embeds:
+            payload['embeds'] = embeds
+        return await self.request('POST', f"/channels/{channel_id}/messages", json=payload)
+
+    async def close(self):
+        await self.session.close()
+
+
+async def daily(db, rest, buffer_size: int):
+    prompt = await db.transaction(prompts.pop_prompt)
+    if prompt is None:
+        print("⚠️ Prompt buffer empty; using a fallback prompt.")
+        fallback = prompts.FALLBACK_PROMPTS
+        prompt = fallback[datetime.now(timezone.utc).toordinal() % len(fallback)]
+    embed = {'title': "🎯 Daily Creative Challenge", 'description': prompt, 'color': 0x3498db}
+    banner = os.getenv('DAILY_BANNER_URL')
+    if banner:
+        embed['image'] = {'url': banner}
+    await rest.send(CHALLENGE_CHANNEL_ID, embeds=[embed])
+    print("✅ Daily challenge posted")
+    # Top the buffer back up now the post is out, so a bot that isn't running
+    # its refill loop (or no bot at all) never runs dry
+    try:
+        added = await prompts.refill(db, prompts.generate_ai_prompt, buffer_size)
+    except Exception as e:
+        print(f"⚠️ Prompt buffer refill failed: {e}")
+        return
+    if added:
+        print(f"🧠 Prompt buffer: generated {added} prompt(s)")
+
+
+async def leaderboard(db, rest, token: str):
+    # The one place the bot user is filtered in SQL: the bot excludes it once in
+    # its in-memory Leaderboard, but a one-shot job has no index to keep, and
+    # loading all of rankings just to slice five rows would cost more than this
+    rows = await db.fetchall(
+        "SELECT user_id, points FROM rankings WHERE user_id IS NOT ? "
+        "ORDER BY points DESC, user_id LIMIT 5",
+        (bot_user_id(token),),
+    )
+    if not rows:
+        print("🏆 No rankings yet; nothing posted")
+        return
+    embed = {
+        'title': "🏆 Top 5 Creators:",
+        'color': 0xf1c40f,
+        'fields': [
+            {'name': f"#{i}", 'value': f"<@{user}> – {pts} pts", 'inline': False}
+            for i, (user, pts) in enumerate(rows, start=1)
+        ],
+    }
+    await rest.send(LEADERBOARD_CHANNEL_ID, embeds=[embed])
+    print("✅ Leaderboard posted")
+
+
+async def vote_summary(db, rest, window_hours: int):
+    rows = await votes.trending(db, window_hours, 5)
+    if not rows:
+        await rest.send(VOTING_HALL_CHANNEL_ID, "🏅 No votes have been cast in the recent window.")
+        return
+    media = await submissions.media_for(db, [msg_id for msg_id, _, _ in rows])
+
+    async def refresh(msg_id, channel_id):
+        try:
+            msg = await rest.request('GET', f"/channels/{channel_id}/messages/{msg_id}")
+        except RuntimeError as e:
+            print(f"⚠️ Could not refresh attachment URL for {msg_id}: {e}")
+            return None
+        return (msg_id, msg['attachments'][0]['url']) if msg.get('attachments') else None
+
+    fresh = [r for r in await asyncio.gather(*(refresh(*s) for s in submissions.stale_media(media))) if r]
+    if fresh:
+        await db.transaction(submissions.refresh_media_urls, fresh)
+        submissions.apply_fresh_urls(media, fresh)
+    guild_id = '@me'
+    if any(msg_id not in media for msg_id, _, _ in rows):
+        guild_id = (await rest.request('GET', f"/channels/{VOTING_HALL_CHANNEL_ID}"))['guild_id']
+    embeds = votes.summary_embeds(rows, media, guild_id, VOTING_HALL_CHANNEL_ID)
+    await rest.send(VOTING_HALL_CHANNEL_ID, embeds=embeds)
+    print(f"✅ Vote summary posted ({len(rows)} submissions)")
+
+
+def _reset_streaks(conn, since: str) -> int:
+    return conn.execute(
+        "UPDATE streaks SET current = 0 WHERE current > 0 AND (last_date IS NULL OR last_date < ?)",
+        (since,),
+    ).rowcount
+
+
+async def streak_reset(db):
+    # A streak survives as long as the member submitted yesterday or today
+    yesterday = (datetime.now(timezone.utc).date() - timedelta(days=1)).isoformat()
+    reset = await db.transaction(_reset_streaks, yesterday)
+    print(f"✅ Reset {reset} lapsed streak(s)")
+
+
+async def run(job: str, db_path: str, token: str):
+    db = Database(db_path, readers=1)
+    rest = Rest(token) if job in ('daily', 'leaderboard', 'vote-summary') else None
+    try:
+        db.setup()
+        if job == 'daily':
+            await daily(db, rest, int(os.getenv('PROMPT_BUFFER_SIZE', '7')))
+        elif job == 'leaderboard':
+            await leaderboard(db, rest, token)
+        elif job == 'vote-summary':
+            await vote_summary(db, rest, int(os.getenv('VOTE_WINDOW_HOURS', '24')))
+        elif job == 'streak-reset':
+            await streak_reset(db)
+        else:
+            backup_dir = os.getenv('BACKUP_DIR') or os.path.join(os.path.dirname(db_path), 'backups')
+            path, size, secs = await snapshot(db, backup_dir, int(os.getenv('BACKUP_KEEP', '7')))
+            print(f"✅ Snapshot {path}: {size / 1024:.0f} KiB in {secs:.2f}s")
+    finally:
+        if rest:
+            await rest.close()
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one LoopBot job over the REST API and exit.")
+    parser.add_argument('job', choices=JOBS)
+    parser.add_argument('--db', default=None, help="database path (default: as bot.py)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    token = os.getenv('DISCORD_BOT_TOKEN')
+    if not token and args.job not in ('streak-reset', 'backup'):
+        print("❌ ERROR: DISCORD_BOT_TOKEN environment variable is missing.")
+        sys.exit(1)
+    db_path = args.db or default_db_path()
+    if not os.path.exists(db_path):
+        print(f"❌ Database not found: {db_path}")
+        sys.exit(1)
+    asyncio.run(run(args.job, db_path, token))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Export, import, verify and maintain LoopBot database tables.
+
+  python dbtool.py export --out backup/ [--format jsonl|csv] [--since 2025-01-01] [--until ...] [--tables a,b]
+  python dbtool.py import --in backup/ [--replace]
+  python dbtool.py verify --in backup/
+  python dbtool.py vacuum
+
+vacuum converts a database created before incremental auto-vacuum, so the
+XP compaction job can hand freed pages back to the OS. It rewrites the whole
+file: stop the bot first.
+
+--db defaults to DB_PATH or the same persistent-volume lookup as bot.py. Times
+are ISO dates/datetimes (UTC) or epoch milliseconds. Exports stream from a
+consistent snapshot, so they are safe to run against the live bot's database.
+"""
+
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+
+from utils.config import default_db_path
+from utils.db import enable_incremental_vacuum
+from utils.transfer import FORMATS, export_data, import_data, verify
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Export, import, verify and maintain LoopBot tables.")
+    parser.add_argument('--db', default=default_db_path())
+    parser.add_argument('--chunk', type=int, default=5000, help="rows per fetch / executemany")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    exp = sub.add_parser('export', help="stream tables to JSONL/CSV files")
+    exp.add_argument('--out', required=True, help="output directory")
+    exp.add_argument('--format', choices=FORMATS, default='jsonl')
+    exp.add_argument('--since', help="only rows at or after this time")
+    exp.add_argument('--until', help="only rows before this time")
+    exp.add_argument('--tables', help="comma-separated subset of tables")
+
+    imp = sub.add_parser('import', help="load an export directory")
+    imp.add_argument('--in', dest='src', required=True, help="export directory")
+    imp.add_argument('--replace', action='store_true', help="overwrite rows with the same key")
+
+    ver = sub.add_parser('verify', help="check files and database against the manifest")
+    ver.add_argument('--in', dest='src', required=True, help="export directory")
+
+    sub.add_parser('vacuum', help="switch to incremental auto-vacuum (full rebuild; bot stopped)")
+
+    args = parser.parse_args()
+    if args.command != 'import' and not os.path.exists(args.db):
+        print(f"❌ Database not found: {args.db}")
+        sys.exit(1)
+
+    if args.command == 'export':
+        tables = set(args.tables.split(',')) if args.tables else None
+        manifest = export_data(
+            args.db, args.out, args.format, args.since, args.until, tables, args.chunk
+        )
+        total = sum(t['rows'] for t in manifest['tables'].values())
+        print(f"✅ Exported {total} rows from {len(manifest['tables'])} tables to {args.out}")
+    elif args.command == 'import':
+        written = import_data(args.db, args.src, args.replace, args.chunk)
+        print(f"✅ Imported {sum(written.values())} rows into {args.db}")
+    elif args.command == 'vacuum':
+        before = os.path.getsize(args.db)
+        if not enable_incremental_vacuum(args.db):
+            print(f"✅ {args.db} already uses incremental auto-vacuum")
+            return
+        after = os.path.getsize(args.db)
+        print(f"✅ Rebuilt {args.db} with incremental auto-vacuum: "
+              f"{before / 1048576:.1f} MiB -> {after / 1048576:.1f} MiB")
+    else:
+        problems = verify(args.db, args.src, args.chunk)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            sys.exit(1)
+        print("✅ Export and database match the manifest")
+
+
+if __name__ == '__main__':
+    main()
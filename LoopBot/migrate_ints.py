@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Convert a LoopBot database to integer user ids and epoch-millisecond timestamps.
+
+The bot converts small databases itself at startup but refuses to start on a
+large one that still needs this (the copy would hold up login). Convert it
+with the previous bot version still serving, in two steps:
+
+  python migrate_ints.py --copy-only   # old bot running: copy rows, keep them in sync
+  # stop the old bot
+  python migrate_ints.py               # finish the copy, swap tables, fix stray values
+  # start the new bot
+
+Rows are copied in small batches, writes made meanwhile are mirrored by
+triggers, and an interrupted run resumes from its last checkpoint. The swap
+needs the old bot stopped: it would keep writing ISO strings into the new
+INTEGER columns and cannot read the converted values. TEXT values that got in
+anyway are converted on every run.
+
+--db defaults to DB_PATH or the same persistent-volume lookup as bot.py.
+
+Usage: python migrate_ints.py [--db rankings.db] [--batch-size 5000] [--sleep 0.05] [--copy-only]
+"""
+
+import argparse
+import os
+import sqlite3
+
+from dotenv import load_dotenv
+
+from utils.config import default_db_path
+from utils.intmigration import CONVERSIONS, fix_text_values, migrate_to_integers, pending_tables
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default=default_db_path())
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--sleep', type=float, default=0.05, help="pause between batches (seconds)")
+    parser.add_argument('--copy-only', action='store_true',
+                        help="copy and sync rows but don't swap tables (old bot may keep running)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"❌ Database not found: {args.db}")
+        raise SystemExit(1)
+    conn = sqlite3.connect(args.db, timeout=30)
+    tables = pending_tables(conn)
+    if tables:
+        print(f"🔢 Migrating {len(tables)} table(s): {', '.join(tables)}")
+        migrate_to_integers(conn, args.batch_size, args.sleep, swap=not args.copy_only)
+    if args.copy_only:
+        conn.close()
+        print("✅ Copy in sync. Stop the old bot, then run again without --copy-only.")
+        return
+    pending = pending_tables(conn)
+    fixed = sum(
+        fix_text_values(conn, t) for t in CONVERSIONS if t not in pending and _has_table(conn, t)
+    )
+    conn.close()
+    if fixed:
+        print(f"🔢 Converted {fixed} TEXT value row(s) written after an earlier swap")
+    print("✅ Migration complete." if tables or fixed else
+          "✅ Nothing to migrate; all ids and timestamps are already integers.")
+
+
+def _has_table(conn, table: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+if __name__ == '__main__':
+    main()
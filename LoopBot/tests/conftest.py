@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The bot runs from LoopBot/ and imports ``utils`` as a top-level package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,178 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from utils import intmigration
+from utils.db import SCHEMA_VERSION, Database, to_ms
+
+# Tables as the pre-migration bot created them: TEXT user ids, ISO timestamps
+LEGACY_SCHEMA = [
+    "CREATE TABLE rankings (user_id TEXT PRIMARY KEY, points INTEGER)",
+    "CREATE TABLE audio_submissions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, "
+    "filename TEXT, timestamp TEXT, thread_id INTEGER, message_id INTEGER, "
+    "orig_message_id INTEGER, tags TEXT)",
+    "CREATE TABLE users (user_id TEXT PRIMARY KEY, xp INTEGER DEFAULT 0, "
+    "level INTEGER DEFAULT 0, last_xp_ts TEXT)",
+    "CREATE TABLE xp_events (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, "
+    "delta INTEGER, reason TEXT, ts TEXT)",
+    "CREATE TABLE message_votes (id INTEGER PRIMARY KEY AUTOINCREMENT, message_id INTEGER, "
+    "voter_id TEXT, score INTEGER, ts TEXT, UNIQUE(message_id, voter_id))",
+]
+
+ISO = ['2025-01-02T03:04:05+00:00', '2025-06-30T23:59:59.500000+02:00', '2024-12-31T12:00:00']
+
+
+def _ms(iso):
+    return to_ms(datetime.fromisoformat(iso))
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    for stmt in LEGACY_SCHEMA:
+        conn.execute(stmt)
+    conn.executemany("INSERT INTO rankings VALUES(?, ?)",
+                     [(str(10**17 + i), i * 3) for i in range(7)])
+    conn.executemany(
+        "INSERT INTO audio_submissions(user_id, filename, timestamp, message_id, tags) "
+        "VALUES(?, ?, ?, ?, ?)",
+        [(str(10**17 + i), f"take{i}.wav", ISO[i % 3], 500 + i, '#lofi') for i in range(5)],
+    )
+    conn.executemany("INSERT INTO users VALUES(?, ?, ?, ?)",
+                     [(str(10**17 + i), i * 10, i, ISO[i % 3]) for i in range(4)])
+    conn.executemany("INSERT INTO xp_events(user_id, delta, reason, ts) VALUES(?, 1, 'message', ?)",
+                     [(str(10**17 + i % 3), ISO[i % 3]) for i in range(11)])
+    conn.executemany("INSERT INTO message_votes(message_id, voter_id, score, ts) VALUES(?, ?, ?, ?)",
+                     [(500 + i % 5, str(10**17 + i), 1 + i % 10, ISO[i % 3]) for i in range(9)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _dump(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall()
+    finally:
+        conn.close()
+
+
+def test_setup_refuses_large_unconverted_database(legacy_db, monkeypatch):
+    monkeypatch.setattr(intmigration, 'INLINE_MAX_ROWS', 10)
+    db = Database(legacy_db, readers=1)
+    try:
+        with pytest.raises(RuntimeError, match='migrate_ints.py'):
+            db.setup()
+    finally:
+        db.close()
+    conn = sqlite3.connect(legacy_db)
+    # Too big to convert inline: nothing is copied and the version stays before the conversion
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 1
+    assert set(intmigration.pending_tables(conn)) == {
+        'rankings', 'audio_submissions', 'users', 'xp_events', 'message_votes'
+    }
+    conn.close()
+
+
+def test_migrate_legacy_fixture_keeps_every_row(legacy_db):
+    before = {table: _dump(legacy_db, table) for table in
+              ('rankings', 'audio_submissions', 'users', 'xp_events', 'message_votes')}
+
+    conn = sqlite3.connect(legacy_db)
+    converted = intmigration.migrate_to_integers(conn, batch_size=2, log=lambda msg: None)
+    assert intmigration.pending_tables(conn) == []
+    conn.close()
+    assert set(converted) == set(before)
+
+    assert _dump(legacy_db, 'rankings') == [(int(uid), pts) for uid, pts in before['rankings']]
+    assert _dump(legacy_db, 'audio_submissions') == [
+        (id_, int(uid), name, _ms(ts), thread, mid, orig, tags)
+        for id_, uid, name, ts, thread, mid, orig, tags in before['audio_submissions']
+    ]
+    assert _dump(legacy_db, 'users') == [
+        (int(uid), xp, lvl, _ms(ts)) for uid, xp, lvl, ts in before['users']
+    ]
+    assert _dump(legacy_db, 'xp_events') == [
+        (id_, int(uid), delta, reason, _ms(ts)) for id_, uid, delta, reason, ts in before['xp_events']
+    ]
+    # message_votes also gains its source column (legacy votes count as commands)
+    assert _dump(legacy_db, 'message_votes') == [
+        (id_, mid, int(uid), score, _ms(ts), 'command')
+        for id_, mid, uid, score, ts in before['message_votes']
+    ]
+
+    db = Database(legacy_db, readers=1)
+    try:
+        assert db.setup() is not None
+    finally:
+        db.close()
+    conn = sqlite3.connect(legacy_db)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    conn.close()
+
+
+def test_writes_during_migration_are_mirrored(legacy_db):
+    conn = sqlite3.connect(legacy_db)
+    cols, keys = intmigration._prepare(conn, 'rankings')
+    assert intmigration._copy_batch(conn, 'rankings', cols, keys, 3) == 3
+    # A bot still on the old schema keeps writing between batches
+    conn.execute("UPDATE rankings SET points = 99 WHERE user_id = ?", (str(10**17),))
+    conn.execute("INSERT INTO rankings VALUES(?, 5)", (str(10**17 + 50),))
+    conn.execute("DELETE FROM rankings WHERE user_id = ?", (str(10**17 + 6),))
+    conn.commit()
+    intmigration.migrate_table(conn, 'rankings', batch_size=3, log=lambda msg: None)
+    rows = dict(conn.execute("SELECT user_id, points FROM rankings").fetchall())
+    conn.close()
+    assert rows == {10**17: 99, **{10**17 + i: i * 3 for i in range(1, 6)}, 10**17 + 50: 5}
+
+
+def test_setup_converts_small_database_inline(legacy_db):
+    before = _dump(legacy_db, 'users')
+    db = Database(legacy_db, readers=1)
+    try:
+        db.setup()
+    finally:
+        db.close()
+    conn = sqlite3.connect(legacy_db)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert intmigration.pending_tables(conn) == []
+    assert conn.execute("SELECT COUNT(*) FROM xp_events").fetchone()[0] == 11
+    conn.close()
+    assert _dump(legacy_db, 'users') == [
+        (int(uid), xp, lvl, _ms(ts)) for uid, xp, lvl, ts in before
+    ]
+
+
+def test_copy_only_keeps_old_table_until_the_swap(legacy_db):
+    conn = sqlite3.connect(legacy_db)
+    intmigration.migrate_to_integers(conn, batch_size=2, log=lambda msg: None, swap=False)
+    # The old bot still sees its TEXT table and keeps writing to it
+    assert conn.execute("SELECT typeof(user_id) FROM rankings LIMIT 1").fetchone() == ('text',)
+    conn.execute("INSERT INTO rankings VALUES(?, 1)", (str(10**17 + 90),))
+    conn.commit()
+    assert 'rankings' in intmigration.pending_tables(conn)
+    intmigration.migrate_to_integers(conn, batch_size=2, log=lambda msg: None)
+    assert intmigration.pending_tables(conn) == []
+    assert conn.execute(
+        "SELECT points FROM rankings WHERE user_id = ?", (10**17 + 90,)
+    ).fetchone() == (1,)
+    conn.close()
+
+
+def test_fix_text_values_after_the_swap(legacy_db):
+    conn = sqlite3.connect(legacy_db)
+    intmigration.migrate_to_integers(conn, log=lambda msg: None)
+    # An old bot still running after the swap writes ISO strings into INTEGER columns
+    conn.execute(
+        "INSERT INTO audio_submissions(user_id, filename, timestamp) VALUES(?, 'late.wav', ?)",
+        (str(10**17 + 1), ISO[0]),
+    )
+    conn.commit()
+    assert intmigration.pending_tables(conn) == []
+    assert intmigration.fix_text_values(conn, 'audio_submissions') == 1
+    assert conn.execute(
+        "SELECT user_id, timestamp, typeof(timestamp) FROM audio_submissions WHERE filename = 'late.wav'"
+    ).fetchone() == (10**17 + 1, _ms(ISO[0]), 'integer')
+    conn.close()
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from utils import submissions, votes
+from utils.db import Database, now_ms
+
+HALL = 100
+SUBMISSIONS = 200
+ELSEWHERE = 300
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'rankings.db'), readers=1)
+    db.setup()
+    yield db
+    db.close()
+
+
+def _stored(conn, message_id):
+    return dict(conn.execute(
+        "SELECT voter_id, source FROM message_votes WHERE message_id = ?", (message_id,)
+    ).fetchall())
+
+
+def _bucket_votes(conn, message_id):
+    return conn.execute(
+        "SELECT COALESCE(SUM(votes), 0) FROM vote_buckets WHERE message_id = ?", (message_id,)
+    ).fetchone()[0]
+
+
+def test_graded_vote_of_one_survives_reactions_and_reconcile(db):
+    async def scenario():
+        ts = now_ms()
+        await db.transaction(
+            submissions.add_submission, 'audio', 1, 'beat.wav', ts, '', 11, 12,
+            [(11, ELSEWHERE, None, None, None, None)],
+        )
+        # 5 used ``!vote 1``; 6 reacted
+        await db.transaction(votes.add_vote, 12, 5, 1, ts)
+        await db.transaction(votes.apply_reactions, [(12, 6, ts)])
+        # A reaction removal by 5 must not touch the command vote
+        assert await db.transaction(votes.apply_reactions, [(12, 5, None)]) == (0, 0)
+
+        fetched = []
+
+        async def fetch_voters(message_id, channel_id):
+            fetched.append((message_id, channel_id))
+            return set()
+
+        await asyncio.sleep(0.002)
+        result = await votes.reconcile(db, fetch_voters, 1, HALL, (SUBMISSIONS, HALL))
+        return fetched, result, await db.read(_stored, 12), await db.read(_bucket_votes, 12)
+
+    fetched, result, stored, bucket_votes = asyncio.run(scenario())
+    # The ``!submit`` message outside the quick-vote channels is never fetched
+    assert fetched == [(12, HALL)]
+    assert result == (1, 0, 1)
+    assert stored == {5: votes.SOURCE_COMMAND}
+    assert bucket_votes == 1
+
+
+def test_reconcile_adds_missing_reaction_votes(db):
+    async def scenario():
+        ts = now_ms()
+        await db.transaction(submissions.record_message, 21, SUBMISSIONS, 1, ts)
+
+        async def fetch_voters(message_id, channel_id):
+            assert channel_id == SUBMISSIONS
+            return {7, 8}
+
+        await asyncio.sleep(0.002)
+        result = await votes.reconcile(db, fetch_voters, 1, HALL, (SUBMISSIONS, HALL))
+        return result, await db.read(_stored, 21)
+
+    result, stored = asyncio.run(scenario())
+    assert result == (1, 2, 0)
+    assert stored == {7: votes.SOURCE_REACTION, 8: votes.SOURCE_REACTION}
@@ -0,0 +1,80 @@
+"""
+Online snapshots of the rankings database.
+
+``snapshot`` copies the live file with the SQLite backup API on a worker
+thread, a few hundred pages per step. The source is a read-only connection
+that holds one read transaction for the whole copy: in WAL mode that pins a
+consistent snapshot, so concurrent writes neither block the copy nor force
+the backup to restart. The copy is gzip-compressed into the backup directory
+and snapshots beyond ``keep`` are deleted, oldest first.
+"""
+
+import asyncio
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timezone
+from urllib.request import pathname2url
+
+SNAPSHOT_PREFIX = 'rankings-'
+SNAPSHOT_SUFFIX = '.db.gz'
+
+
+def list_snapshots(dest_dir: str):
+    """Snapshot paths in ``dest_dir``, oldest first."""
+    return sorted(glob.glob(os.path.join(dest_dir, f"{SNAPSHOT_PREFIX}*{SNAPSHOT_SUFFIX}")))
+
+
+def _rotate(dest_dir: str, keep: int):
+    for path in list_snapshots(dest_dir)[:-keep] if keep > 0 else []:
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"⚠️ Could not remove old snapshot {path}: {e}")
+
+
+def _copy(src_path: str, dest_path: str, pages: int):
+    src = sqlite3.connect(
+        f"file:{pathname2url(os.path.abspath(src_path))}?mode=ro", uri=True, isolation_level=None
+    )
+    dst = sqlite3.connect(dest_path)
+    try:
+        # Pin one read snapshot for every backup step
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        src.backup(dst, pages=pages)
+        src.execute("COMMIT")
+    finally:
+        dst.close()
+        src.close()
+
+
+def _snapshot(src_path: str, dest_dir: str, keep: int, pages: int):
+    os.makedirs(dest_dir, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')
+    final = os.path.join(dest_dir, f"{SNAPSHOT_PREFIX}{stamp}{SNAPSHOT_SUFFIX}")
+    raw, part = final + '.tmp', final + '.part'
+    try:
+        _copy(src_path, raw, pages)
+        with open(raw, 'rb') as f_in, gzip.open(part, 'wb', compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        os.replace(part, final)
+    finally:
+        for leftover in (raw, part):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    _rotate(dest_dir, keep)
+    return final, os.path.getsize(final)
+
+
+async def snapshot(db, dest_dir: str, keep: int = 7, pages: int = 512):
+    """Write a compressed, consistent snapshot of ``db`` to ``dest_dir``.
+
+    Returns ``(path, size_bytes, seconds)``; runs entirely off the event loop.
+    """
+    started = time.perf_counter()
+    path, size = await asyncio.to_thread(_snapshot, db.path, dest_dir, keep, pages)
+    return path, size, time.perf_counter() - started
@@ -0,0 +1,33 @@
+"""
+Settings shared by bot.py and the single-run tools (cron.py, dbtool.py, migrate_ints.py).
+
+Kept free of Discord and other heavy imports so the tools stay cheap to start.
+"""
+
+import os
+
+CHALLENGE_CHANNEL_ID = 1393808509463691294  # current-challenge
+VOTING_HALL_CHANNEL_ID = 1393808682407428127  # voting-hall
+LEADERBOARD_CHANNEL_ID = 1393810922396585984  # leaderboard
+
+
+def persistent_dir():
+    """RAILWAY_PERSISTENT_DIR/DATA_DIR, else a mounted /data, else LoopBot/data; None if none exists."""
+    env_dir = os.getenv('RAILWAY_PERSISTENT_DIR') or os.getenv('DATA_DIR')
+    if env_dir:
+        return env_dir
+    local_dir = os.path.join(os.getcwd(), 'LoopBot', 'data')
+    for directory in ('/data', local_dir):
+        if os.path.isdir(directory):
+            return directory
+    return None
+
+
+def default_db_path() -> str:
+    """DB_PATH, else rankings.db on the persistent volume, else in the working directory."""
+    if os.getenv('DB_PATH'):
+        return os.getenv('DB_PATH')
+    directory = persistent_dir()
+    if directory and os.path.isdir(directory):
+        return os.path.join(directory, 'rankings.db')
+    return os.path.join(os.getcwd(), 'rankings.db')
@@ -1,9 +1,719 @@
 """
 Database helper functions.
+
+All SQLite access from the bot goes through :class:`Database`, which keeps the
+blocking sqlite3 calls off the asyncio event loop. Writes are serialized on a
+single writer thread (one connection, one transaction at a time) and reads are
+spread over a small pool of reader threads, each with its own connection.
+
+Schema changes are versioned: :data:`MIGRATIONS` is applied in order and the
+last applied version is kept in ``PRAGMA user_version``. Slow backfills of
+derived data are queued as background jobs and drained in small batches
+after startup (:func:`run_background_migrations`).
 """
 
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.request import pathname2url
+
+# Base schema (include tags/orig_message_id/timestamp columns). User ids are
+# integer snowflakes and timestamps integer epoch milliseconds (UTC).
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS rankings (
+    user_id INTEGER PRIMARY KEY,
+    points INTEGER
+)''',
+    '''CREATE TABLE IF NOT EXISTS audio_submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    filename TEXT,
+    timestamp INTEGER,
+    thread_id INTEGER,
+    message_id INTEGER,
+    orig_message_id INTEGER,
+    tags TEXT
+)''',
+    '''CREATE TABLE IF NOT EXISTS link_submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    link TEXT,
+    timestamp INTEGER,
+    tags TEXT,
+    thread_id INTEGER,
+    message_id INTEGER,
+    orig_message_id INTEGER
+)''',
+    '''CREATE TABLE IF NOT EXISTS votes (
+    user_id INTEGER,
+    submission_id INTEGER,
+    score INTEGER,
+    timestamp INTEGER,
+    PRIMARY KEY(user_id, submission_id)
+)''',
+    ## XP & leveling tables
+    '''CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    xp INTEGER DEFAULT 0,
+    level INTEGER DEFAULT 0,
+    last_xp_ts INTEGER
+)''',
+    '''CREATE TABLE IF NOT EXISTS xp_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    delta INTEGER,
+    reason TEXT,
+    ts INTEGER
+)''',
+    ## Streak tracking table
+    '''CREATE TABLE IF NOT EXISTS streaks (
+    user_id INTEGER PRIMARY KEY,
+    current INTEGER DEFAULT 0,
+    best INTEGER DEFAULT 0,
+    last_date TEXT
+)''',
+    ## Optional DM reminders opt-in
+    '''CREATE TABLE IF NOT EXISTS reminders (
+    user_id INTEGER PRIMARY KEY
+)''',
+    # Messages & voting v2 tables
+    '''CREATE TABLE IF NOT EXISTS messages (
+    message_id INTEGER PRIMARY KEY,
+    channel_id INTEGER,
+    author_id INTEGER,
+    timestamp INTEGER
+)''',
+    '''CREATE TABLE IF NOT EXISTS message_votes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_id INTEGER,
+    voter_id INTEGER,
+    score INTEGER,
+    ts INTEGER,
+    source TEXT NOT NULL DEFAULT 'command',
+    UNIQUE(message_id, voter_id)
+)''',
+    # Any voting-hall/original/raw submission message id -> its submission
+    '''CREATE TABLE IF NOT EXISTS submission_index (
+    message_id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    submission_id INTEGER NOT NULL,
+    timestamp INTEGER
+)''',
+    '''CREATE INDEX IF NOT EXISTS idx_submission_index_ts ON submission_index(timestamp)''',
+    '''CREATE INDEX IF NOT EXISTS idx_rankings_points ON rankings(points DESC)''',
+    '''CREATE INDEX IF NOT EXISTS idx_audio_submissions_orig ON audio_submissions(orig_message_id)''',
+    # Inverted tag index: normalized tag -> submission
+    '''CREATE TABLE IF NOT EXISTS submission_tags (
+    tag TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    submission_id INTEGER NOT NULL,
+    timestamp INTEGER,
+    PRIMARY KEY(tag, kind, submission_id)
+) WITHOUT ROWID''',
+    '''CREATE INDEX IF NOT EXISTS idx_submission_tags_ts ON submission_tags(tag, timestamp)''',
+    '''CREATE INDEX IF NOT EXISTS idx_submission_tags_sub ON submission_tags(kind, submission_id)''',
+    # Small key/value store for job watermarks and checkpoints
+    '''CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+)''',
+    # Per-user daily XP rollups of xp_events
+    '''CREATE TABLE IF NOT EXISTS xp_daily (
+    user_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    xp INTEGER NOT NULL DEFAULT 0,
+    events INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY(user_id, day)
+) WITHOUT ROWID''',
+    # Per-submission vote totals bucketed by UTC epoch hour of the vote
+    '''CREATE TABLE IF NOT EXISTS vote_buckets (
+    hour INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    votes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY(hour, message_id)
+) WITHOUT ROWID''',
+    # Final vote tally of each submission message, written when its window closes
+    '''CREATE TABLE IF NOT EXISTS vote_results (
+    message_id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    submission_id INTEGER NOT NULL,
+    author_id INTEGER,
+    votes INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    closed_at INTEGER
+)''',
+    # What a summary needs to show a submission message without fetching it
+    '''CREATE TABLE IF NOT EXISTS submission_media (
+    message_id INTEGER PRIMARY KEY,
+    channel_id INTEGER,
+    jump_url TEXT,
+    url TEXT,
+    content_type TEXT,
+    size INTEGER,
+    expires_at INTEGER
+)''',
+    # Ready-to-post AI daily prompts, oldest first
+    '''CREATE TABLE IF NOT EXISTS prompt_buffer (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prompt TEXT NOT NULL,
+    created_at INTEGER
+)''',
+]
+
+
+def now_ms() -> int:
+    """Current UTC time as integer epoch milliseconds."""
+    return time.time_ns() // 1_000_000
+
+
+def to_ms(dt: datetime) -> int:
+    """Convert an aware (or UTC-naive) datetime to epoch milliseconds."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def from_ms(ms: int) -> datetime:
+    """Convert epoch milliseconds back to an aware UTC datetime."""
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+
+
+def get_meta(conn, key: str, default=None):
+    """Read a value from the meta table."""
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_meta(conn, key: str, value):
+    """Write a value to the meta table (call inside a transaction)."""
+    conn.execute(
+        "INSERT INTO meta(key, value) VALUES(?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, None if value is None else str(value)),
+    )
+
+
+# meta key: '1' once submission_fts exists, '0' while SQLite lacks FTS5
+FTS_AVAILABLE = 'fts_available'
+
+# Full-text index over link bodies and attachment filenames. FTS rowids encode
+# the source row: link id * 2 for link_submissions, audio id * 2 + 1 for
+# audio_submissions, so the sync triggers touch a single rowid.
+FTS_SCHEMA = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS submission_fts USING fts5(
+    body,
+    tokenize = 'unicode61 remove_diacritics 2'
+)''',
+    '''CREATE TRIGGER IF NOT EXISTS link_submissions_fts_ai AFTER INSERT ON link_submissions BEGIN
+    INSERT INTO submission_fts(rowid, body) VALUES (new.id * 2, new.link);
+END''',
+    '''CREATE TRIGGER IF NOT EXISTS link_submissions_fts_au AFTER UPDATE OF link ON link_submissions BEGIN
+    DELETE FROM submission_fts WHERE rowid = old.id * 2;
+    INSERT INTO submission_fts(rowid, body) VALUES (new.id * 2, new.link);
+END''',
+    '''CREATE TRIGGER IF NOT EXISTS link_submissions_fts_ad AFTER DELETE ON link_submissions BEGIN
+    DELETE FROM submission_fts WHERE rowid = old.id * 2;
+END''',
+    '''CREATE TRIGGER IF NOT EXISTS audio_submissions_fts_ai AFTER INSERT ON audio_submissions BEGIN
+    INSERT INTO submission_fts(rowid, body) VALUES (new.id * 2 + 1, new.filename);
+END''',
+    '''CREATE TRIGGER IF NOT EXISTS audio_submissions_fts_au AFTER UPDATE OF filename ON audio_submissions BEGIN
+    DELETE FROM submission_fts WHERE rowid = old.id * 2 + 1;
+    INSERT INTO submission_fts(rowid, body) VALUES (new.id * 2 + 1, new.filename);
+END''',
+    '''CREATE TRIGGER IF NOT EXISTS audio_submissions_fts_ad AFTER DELETE ON audio_submissions BEGIN
+    DELETE FROM submission_fts WHERE rowid = old.id * 2 + 1;
+END''',
+]
+
+
+def _schema_table(stmt: str):
+    m = re.search(r"(?:TABLE IF NOT EXISTS|ON) (\w+)", stmt)
+    return m.group(1) if m else None
+
+
+def _create(conn, *tables, indexes: bool = True):
+    """Run the SCHEMA statements that create ``tables`` (and their indexes)."""
+    for stmt in SCHEMA:
+        if _schema_table(stmt) in tables and (indexes or stmt.startswith('CREATE TABLE')):
+            conn.execute(stmt)
+
+
+# Columns added to early tables after their first release
+_LEGACY_COLUMNS = [
+    ('audio_submissions', 'tags', 'TEXT'),
+    ('audio_submissions', 'orig_message_id', 'INTEGER'),
+    ('link_submissions', 'tags', 'TEXT'),
+    ('link_submissions', 'orig_message_id', 'INTEGER'),
+    ('votes', 'timestamp', 'INTEGER'),
+]
+
+
+def _add_columns(conn, columns):
+    """Add each missing ``(table, column, decl)`` column."""
+    for table, column, decl in columns:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _m_base_tables(conn):
+    """base tables and legacy columns"""
+    _create(
+        conn, 'rankings', 'audio_submissions', 'link_submissions', 'votes', 'users',
+        'xp_events', 'streaks', 'reminders', 'messages', 'message_votes', 'meta',
+        indexes=False,
+    )
+    _add_columns(conn, _LEGACY_COLUMNS)
+
+
+def _m_integer_ids(conn):
+    """integer user ids and epoch-ms timestamps"""
+    from .intmigration import pending_tables, rebuild_table, small_enough
+
+    tables = pending_tables(conn)
+    if not tables:
+        return
+    # Small (e.g. the bundled empty rankings.db) converts right here; a big copy
+    # would hold up login, so that one is migrate_ints.py's job
+    if not small_enough(conn, tables):
+        raise RuntimeError(
+            f"Database still has TEXT ids/timestamps in {', '.join(tables)}; "
+            "run `python LoopBot/migrate_ints.py` against it (see README), then start again"
+        )
+    for table in tables:
+        print(f"🔢 Converted {table} to integer ids/timestamps ({rebuild_table(conn, table)} rows)")
+
+
+def _m_submission_index(conn):
+    """submission_index registry"""
+    _create(conn, 'submission_index')
+    insert = (
+        "INSERT OR IGNORE INTO submission_index(message_id, kind, submission_id, timestamp) "
+    )
+    # Synchronous on purpose, unlike the BACKGROUND_MIGRATIONS jobs: both vote
+    # paths look submissions up only here, so a partial index would reject votes
+    # on older submissions. It runs once, one INSERT..SELECT per source table.
+    # Same precedence the vote paths used to probe in: messages, then voting-hall
+    # posts, then original member messages.
+    conn.execute(
+        insert + "SELECT message_id, 'message', message_id, timestamp FROM messages"
+    )
+    for column in ('message_id', 'orig_message_id'):
+        for kind, table in (('audio', 'audio_submissions'), ('link', 'link_submissions')):
+            conn.execute(
+                insert + f"SELECT {column}, ?, id, timestamp FROM {table} "
+                f"WHERE {column} IS NOT NULL",
+                (kind,),
+            )
+
+
+def _m_rankings_points_index(conn):
+    """rankings points index"""
+    _create(conn, 'rankings')
+
+
+def _m_submission_tags(conn):
+    """submission_tags inverted index"""
+    _create(conn, 'submission_tags')
+    schedule_background(conn, 'submission_tags')
+
+
+def _m_xp_rollups(conn):
+    """xp_daily rollups"""
+    _create(conn, 'xp_daily')
+
+
+def _m_vote_buckets(conn):
+    """hourly vote_buckets"""
+    _create(conn, 'vote_buckets')
+    # Synchronous on purpose: vote writes adjust buckets by deltas, so a batched
+    # backfill racing live votes would miscount (a removed vote would subtract
+    # from a bucket not filled yet). It is one GROUP BY, run once.
+    # Rebuilt from scratch so re-running over a half-migrated file is harmless
+    conn.execute("DELETE FROM vote_buckets")
+    conn.execute(
+        "INSERT INTO vote_buckets(hour, message_id, total, votes) "
+        "SELECT ts / 3600000 AS hour, message_id, SUM(score), COUNT(*) "
+        "FROM message_votes WHERE ts IS NOT NULL GROUP BY hour, message_id"
+    )
+
+
+def _install_fts(conn) -> bool:
+    """Create submission_fts and queue its backfill; record in meta whether it worked."""
+    # Full-text search needs an SQLite build with FTS5; !find is disabled without it
+    try:
+        for stmt in FTS_SCHEMA:
+            conn.execute(stmt)
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Full-text search unavailable (SQLite FTS5 missing?): {e}")
+        set_meta(conn, FTS_AVAILABLE, 0)
+        return False
+    set_meta(conn, FTS_AVAILABLE, 1)
+    schedule_background(conn, 'submission_fts')
+    return True
+
+
+def _m_submission_fts(conn):
+    """submission_fts full-text index"""
+    # Later migrations don't depend on it, so a missing FTS5 doesn't block
+    # them; setup_db retries on every start until it succeeds
+    _install_fts(conn)
+
+
+def _m_vote_results(conn):
+    """vote_results settlement table"""
+    _create(conn, 'vote_results', 'audio_submissions')
+
+
+def _m_submission_media(conn):
+    """submission_media attachment cache"""
+    _create(conn, 'submission_media')
+
+
+def _m_prompt_buffer(conn):
+    """prompt_buffer of pre-generated prompts"""
+    _create(conn, 'prompt_buffer')
+
+
+def _m_message_vote_source(conn):
+    """message_votes source column"""
+    # Existing rows can't be told apart, so they count as command votes: reaction
+    # handling never removes those, at worst a stale quick vote lingers
+    _add_columns(conn, [('message_votes', 'source', "TEXT NOT NULL DEFAULT 'command'")])
+
+
+# Append-only: the position in this list (1-based) is the schema version
+# recorded in PRAGMA user_version once the migration has been applied.
+MIGRATIONS = [
+    _m_base_tables,
+    _m_integer_ids,
+    _m_submission_index,
+    _m_rankings_points_index,
+    _m_submission_tags,
+    _m_xp_rollups,
+    _m_vote_buckets,
+    _m_submission_fts,
+    _m_vote_results,
+    _m_submission_media,
+    _m_prompt_buffer,
+    _m_message_vote_source,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(connection) -> int:
+    """Apply pending migrations in order and return the schema version.
+
+    Each migration and its ``user_version`` bump commit together, so a failed
+    migration is retried on the next start. An up-to-date database costs a
+    single pragma read.
+    """
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return version
+    for version in range(version + 1, SCHEMA_VERSION + 1):
+        fn = MIGRATIONS[version - 1]
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            fn(connection)
+            connection.execute(f"PRAGMA user_version = {version}")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        print(f"🗄️ Applied schema migration {version}: {fn.__doc__}")
+    return version
+
+
+# PRAGMA auto_vacuum value: freed pages are kept until PRAGMA incremental_vacuum
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def enable_incremental_vacuum(path: str) -> bool:
+    """Switch an existing database file to incremental auto-vacuum.
+
+    This is a full ``VACUUM``: it rewrites the whole file under an exclusive
+    lock and needs free disk space for a copy, so run it offline with the bot
+    stopped (``python dbtool.py vacuum``). Returns False if nothing was to do.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+            return False
+        conn.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+        conn.execute("VACUUM")
+        return True
+    finally:
+        conn.close()
+
+
+def retry_fts(connection) -> bool:
+    """Install submission_fts if migration 8 couldn't; return True if it was installed now."""
+    if get_meta(connection, FTS_AVAILABLE) != '0':
+        return False
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        installed = _install_fts(connection)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    if installed:
+        print("🔎 Full-text search enabled; backfill queued")
+    return installed
+
+
 def setup_db(connection):
     """Initialize database schema and return a cursor."""
-    cursor = connection.cursor()
-    # TODO: implement database setup logic
-    return cursor
+    before = connection.execute("PRAGMA user_version").fetchone()[0]
+    migrate(connection)
+    # Unless migration 8 (submission_fts) has only just tried
+    if before >= MIGRATIONS.index(_m_submission_fts) + 1:
+        retry_fts(connection)
+    return connection.cursor()
+
+
+# -- background data migrations ----------------------------------------------
+#
+# Backfills of derived data run after startup in small batches: each job walks
+# its source tables by id, one short transaction per batch, and keeps its
+# position in ``meta`` so a restart resumes where it stopped. Rows written
+# after a job was scheduled are maintained by the normal write paths, so each
+# job only covers ids up to the maximum recorded when it was scheduled.
+
+def _bg_submission_tags(table, kind):
+    def apply(conn, lo, hi):
+        from .submissions import index_tags
+
+        rows = conn.execute(
+            f"SELECT id, tags, timestamp FROM {table} "
+            "WHERE id > ? AND id <= ? AND tags IS NOT NULL AND tags != ''",
+            (lo, hi),
+        ).fetchall()
+        for sub_id, tags, ts in rows:
+            index_tags(conn, kind, sub_id, tags, ts)
+    return apply
+
+
+def _bg_submission_fts(table, column, odd):
+    rowid = f"id * 2 + {odd}"
+
+    def apply(conn, lo, hi):
+        conn.execute(
+            f"DELETE FROM submission_fts WHERE rowid IN "
+            f"(SELECT {rowid} FROM {table} WHERE id > ? AND id <= ?)",
+            (lo, hi),
+        )
+        conn.execute(
+            f"INSERT INTO submission_fts(rowid, body) SELECT {rowid}, {column} FROM {table} "
+            f"WHERE id > ? AND id <= ? AND {column} IS NOT NULL",
+            (lo, hi),
+        )
+    return apply
+
+
+# job name -> [(source table, apply(conn, lo, hi) for ids in (lo, hi])]
+BACKGROUND_MIGRATIONS = {
+    'submission_tags': [
+        ('audio_submissions', _bg_submission_tags('audio_submissions', 'audio')),
+        ('link_submissions', _bg_submission_tags('link_submissions', 'link')),
+    ],
+    'submission_fts': [
+        ('link_submissions', _bg_submission_fts('link_submissions', 'link', 0)),
+        ('audio_submissions', _bg_submission_fts('audio_submissions', 'filename', 1)),
+    ],
+}
+
+
+def schedule_background(conn, name: str):
+    """Queue a background job over the rows that exist right now."""
+    upto = [
+        conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+        for table, _ in BACKGROUND_MIGRATIONS[name]
+    ]
+    set_meta(conn, f"bgmigrate:{name}", json.dumps({'step': 0, 'last': 0, 'upto': upto}))
+
+
+def _background_batch(conn, name: str, batch_size: int) -> int:
+    key = f"bgmigrate:{name}"
+    state = json.loads(get_meta(conn, key))
+    steps = BACKGROUND_MIGRATIONS[name]
+    while state['step'] < len(steps):
+        table, apply = steps[state['step']]
+        count, hi = conn.execute(
+            f"SELECT COUNT(*), MAX(id) FROM (SELECT id FROM {table} "
+            "WHERE id > ? AND id <= ? ORDER BY id LIMIT ?)",
+            (state['last'], state['upto'][state['step']], batch_size),
+        ).fetchone()
+        if count:
+            apply(conn, state['last'], hi)
+            state['last'] = hi
+            set_meta(conn, key, json.dumps(state))
+            return count
+        state['step'] += 1
+        state['last'] = 0
+    conn.execute("DELETE FROM meta WHERE key = ?", (key,))
+    return 0
+
+
+def pending_background(conn):
+    """Names of background jobs that have not finished yet."""
+    return [
+        row[0][len('bgmigrate:'):]
+        for row in conn.execute("SELECT key FROM meta WHERE key LIKE 'bgmigrate:%'")
+    ]
+
+
+async def run_background_migrations(db, batch_size: int = 1000, pause: float = 0.05) -> int:
+    """Drain every pending background job; safe to call on each start."""
+    done = 0
+    for name in await db.read(pending_background):
+        if name not in BACKGROUND_MIGRATIONS:
+            continue
+        while True:
+            n = await db.transaction(_background_batch, name, batch_size)
+            if not n:
+                break
+            done += n
+            # Give interactive writes a turn on the writer thread
+            await asyncio.sleep(pause)
+        print(f"🗄️ Background migration {name} finished")
+    return done
+
+
+class Database:
+    """Async access to the rankings database.
+
+    Every public coroutine hands its work to a background thread, so handlers
+    only ever await a future and the event loop never blocks on disk I/O or an
+    fsync. Writes run one at a time on the writer thread, each in its own
+    transaction; reads may run concurrently on the reader pool.
+
+    The file runs in WAL mode, so readers see a consistent snapshot while the
+    writer commits and neither blocks the other. Reader connections are opened
+    read-only. Automatic checkpoints are disabled on the writer so no commit
+    pays for one; call :meth:`checkpoint` periodically instead.
+    """
+
+    def __init__(self, path: str, readers: int = 2, timeout: float = 30.0,
+                 cache_mb: int = 16, mmap_mb: int = 64):
+        self.path = path
+        self.timeout = timeout
+        self.cache_mb = cache_mb
+        self.mmap_mb = mmap_mb
+        self._local = threading.local()
+        self._conns = []
+        self._conns_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._readers = ThreadPoolExecutor(
+            max_workers=max(1, readers), thread_name_prefix='db-reader'
+        )
+
+    def _connect(self, readonly: bool = False):
+        """Open a tuned connection for the calling (worker) thread."""
+        if readonly:
+            conn = sqlite3.connect(
+                f"file:{pathname2url(os.path.abspath(self.path))}?mode=ro",
+                uri=True, timeout=self.timeout, check_same_thread=False,
+            )
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            # Only takes effect on a brand-new file (before WAL writes its header);
+            # existing files convert offline with enable_incremental_vacuum
+            conn.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+            conn.execute("PRAGMA journal_mode = WAL")
+            # WAL + NORMAL only fsyncs at checkpoints; a crash can lose the last
+            # commits but never corrupts the file
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA wal_autocheckpoint = 0")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_mb * 1024)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_mb * 1024 * 1024)}")
+        return conn
+
+    def _connection(self, readonly: bool = False):
+        """Return this worker thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect(readonly)
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    # -- thread-side helpers -------------------------------------------------
+
+    def _write(self, fn, *args):
+        conn = self._connection()
+        with conn:
+            return fn(conn, *args)
+
+    def _read(self, fn, *args):
+        return fn(self._connection(readonly=True), *args)
+
+    def _checkpoint(self, mode):
+        return tuple(self._connection().execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+
+    async def _submit(self, executor, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, fn, *args)
+
+    # -- public API ----------------------------------------------------------
+
+    def setup(self, fn=setup_db):
+        """Run schema setup on the writer connection (blocking; call before the loop starts)."""
+        return self._writer.submit(lambda: fn(self._connection())).result()
+
+    async def transaction(self, fn, *args):
+        """Run ``fn(conn, *args)`` on the writer thread inside a single transaction."""
+        return await self._submit(self._writer, self._write, fn, *args)
+
+    async def execute(self, sql: str, params=()):
+        """Execute one write statement in its own transaction and return ``lastrowid``."""
+        return await self.transaction(lambda conn: conn.execute(sql, params).lastrowid)
+
+    async def executemany(self, sql: str, seq_of_params):
+        """Execute a write statement for every parameter set in one transaction."""
+        return await self.transaction(lambda conn: conn.executemany(sql, seq_of_params).rowcount)
+
+    async def read(self, fn, *args):
+        """Run ``fn(conn, *args)`` on a reader thread."""
+        return await self._submit(self._readers, self._read, fn, *args)
+
+    async def fetchone(self, sql: str, params=()):
+        """Run a query on the reader pool and return the first row (or None)."""
+        return await self.read(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params=()):
+        """Run a query on the reader pool and return all rows."""
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def checkpoint(self, mode: str = 'PASSIVE'):
+        """Checkpoint the WAL on the writer thread.
+
+        Returns ``(busy, wal_pages, checkpointed_pages)``. ``PASSIVE`` never
+        waits for readers; ``TRUNCATE`` also resets the WAL file to zero bytes.
+        """
+        if mode not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+            raise ValueError(f"unknown checkpoint mode: {mode}")
+        return await self._submit(self._writer, self._checkpoint, mode)
+
+    def close(self):
+        """Wait for pending work, then close every connection."""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._conns_lock:
+            # Writer (opened first by setup) closes last so it can checkpoint
+            # and remove the WAL; read-only connections cannot
+            for conn in reversed(self._conns):
+                conn.close()
+            self._conns.clear()
@@ -0,0 +1,261 @@
+"""
+Online migration of TEXT ids / ISO timestamps to INTEGER columns.
+
+Older databases store Discord user ids as TEXT and timestamps as ISO-8601
+TEXT. SQLite cannot change a column's type in place, so each affected table
+is rebuilt into ``<table>__new`` (declared by the current ``SCHEMA``):
+
+1. triggers on the old table mirror every insert/update/delete into the new
+   one, converting values on the way, so the old bot can keep writing;
+2. existing rows are copied in small keyset-paginated batches, each in its
+   own short transaction with the watermark checkpointed in ``meta``
+   (an interrupted run resumes where it left off);
+3. one short final transaction drops the old table, renames the new one into
+   place and recreates its indexes and triggers.
+
+After step 3 the old bot must no longer run: it would write ISO strings into
+the INTEGER columns and cannot read the converted values. Stop it before the
+swap (``migrate_ints.py --copy-only`` does steps 1-2 only);
+:func:`fix_text_values` converts any TEXT values that got in anyway.
+
+Small databases skip all that: :func:`rebuild_table` converts a table in one
+statement inside the caller's transaction, which the startup migration uses
+when every pending table is below :data:`INLINE_MAX_ROWS`.
+"""
+
+import json
+import re
+import time
+
+from .db import FTS_SCHEMA, SCHEMA, _create, get_meta, set_meta
+
+# Pending tables with at most this many rows in total convert inline at startup
+INLINE_MAX_ROWS = 10000
+
+# table -> {column: 'id' | 'ts'}
+CONVERSIONS = {
+    'rankings': {'user_id': 'id'},
+    'audio_submissions': {'user_id': 'id', 'timestamp': 'ts'},
+    'link_submissions': {'user_id': 'id', 'timestamp': 'ts'},
+    'votes': {'user_id': 'id', 'timestamp': 'ts'},
+    'users': {'user_id': 'id', 'last_xp_ts': 'ts'},
+    'xp_events': {'user_id': 'id', 'ts': 'ts'},
+    'streaks': {'user_id': 'id'},
+    'reminders': {'user_id': 'id'},
+    'messages': {'author_id': 'id', 'timestamp': 'ts'},
+    'message_votes': {'voter_id': 'id', 'ts': 'ts'},
+    'submission_index': {'timestamp': 'ts'},
+    'submission_tags': {'timestamp': 'ts'},
+    'xp_daily': {'user_id': 'id'},
+}
+
+_CONVERTERS = {
+    'id': "CASE WHEN typeof({v}) = 'text' THEN CAST({v} AS INTEGER) ELSE {v} END",
+    # julianday() understands ISO-8601 with offsets and returns UTC days
+    'ts': (
+        "CASE WHEN typeof({v}) = 'text' "
+        "THEN CAST(ROUND((julianday({v}) - 2440587.5) * 86400000) AS INTEGER) ELSE {v} END"
+    ),
+}
+
+
+def _create_sql(table: str) -> str:
+    for stmt in SCHEMA:
+        if re.match(rf"CREATE TABLE IF NOT EXISTS {table} \(", stmt):
+            return stmt.replace(f"EXISTS {table} (", f"EXISTS {table}__new (", 1)
+    raise KeyError(table)
+
+
+def _columns(conn, table: str):
+    return conn.execute(f"PRAGMA table_info({table})").fetchall()
+
+
+def _exists(conn, table: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+
+def pending_tables(conn):
+    """Return the tables that still need converting (or are mid-conversion)."""
+    out = []
+    for table, conv in CONVERSIONS.items():
+        if not _exists(conn, table):
+            continue
+        types = {row[1]: (row[2] or '').upper() for row in _columns(conn, table)}
+        if _exists(conn, f"{table}__new") or any(
+            col in types and types[col] != 'INTEGER' for col in conv
+        ):
+            out.append(table)
+    return out
+
+
+def _expr(table: str, col: str, prefix: str = '') -> str:
+    kind = CONVERSIONS[table].get(col)
+    ref = f"{prefix}{col}"
+    return _CONVERTERS[kind].format(v=ref) if kind else ref
+
+
+def _prepare(conn, table: str):
+    """Create the new table and the change-capture triggers (idempotent)."""
+    # Watermarks live in meta, which a database older than the bot's setup lacks
+    _create(conn, 'meta')
+    conn.execute(_create_sql(table))
+    # Only columns both versions have (very old tables may lack some)
+    new_cols = {row[1] for row in _columns(conn, f"{table}__new")}
+    old = _columns(conn, table)
+    cols = [row[1] for row in old if row[1] in new_cols]
+    keys = [row[1] for row in sorted(old, key=lambda r: r[5]) if row[5]]
+    col_list = ', '.join(cols)
+    new_vals = ', '.join(_expr(table, c, 'new.') for c in cols)
+    key_match = ' AND '.join(f"{k} = {_expr(table, k, 'old.')}" for k in keys)
+    conn.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {table}__mig_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT OR REPLACE INTO {table}__new({col_list}) VALUES ({new_vals}); END"
+    )
+    conn.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {table}__mig_au AFTER UPDATE ON {table} BEGIN "
+        f"DELETE FROM {table}__new WHERE {key_match}; "
+        f"INSERT OR REPLACE INTO {table}__new({col_list}) VALUES ({new_vals}); END"
+    )
+    conn.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {table}__mig_ad AFTER DELETE ON {table} BEGIN "
+        f"DELETE FROM {table}__new WHERE {key_match}; END"
+    )
+    conn.commit()
+    return cols, keys
+
+
+def _copy_batch(conn, table: str, cols, keys, batch_size: int) -> int:
+    mark_key = f"intmigrate:{table}"
+    mark = get_meta(conn, mark_key)
+    where, params = '', []
+    if mark:
+        where = f"WHERE ({', '.join(keys)}) > ({', '.join('?' * len(keys))})"
+        params = json.loads(mark)
+    rows = conn.execute(
+        f"SELECT {', '.join(keys)} FROM {table} {where} "
+        f"ORDER BY {', '.join(keys)} LIMIT ?",
+        params + [batch_size],
+    ).fetchall()
+    if not rows:
+        return 0
+    last = list(rows[-1])
+    upto = f"({', '.join(keys)}) <= ({', '.join('?' * len(keys))})"
+    conn.execute(
+        f"INSERT OR IGNORE INTO {table}__new({', '.join(cols)}) "
+        f"SELECT {', '.join(_expr(table, c) for c in cols)} FROM {table} "
+        f"{where + ' AND ' if where else 'WHERE '}{upto}",
+        params + last,
+    )
+    set_meta(conn, mark_key, json.dumps(last))
+    conn.commit()
+    return len(rows)
+
+
+def _replace(conn, table: str):
+    """Put ``<table>__new`` in place of ``table`` (inside the caller's transaction)."""
+    has_fts = _exists(conn, 'submission_fts')
+    for suffix in ('ai', 'au', 'ad'):
+        conn.execute(f"DROP TRIGGER IF EXISTS {table}__mig_{suffix}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}__new RENAME TO {table}")
+    # Indexes and triggers went with the old table; recreate them
+    for stmt in SCHEMA + (FTS_SCHEMA if has_fts else []):
+        if stmt.startswith(('CREATE INDEX', 'CREATE TRIGGER')) and re.search(rf"\bON {table}\b", stmt):
+            conn.execute(stmt)
+    if _exists(conn, 'meta'):
+        conn.execute("DELETE FROM meta WHERE key = ?", (f"intmigrate:{table}",))
+
+
+def _swap(conn, table: str):
+    # Batches covered every row that existed when the triggers were created and
+    # the triggers covered everything since, so the swap itself copies nothing.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _replace(conn, table)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def rebuild_table(conn, table: str) -> int:
+    """Convert ``table`` in one go inside the caller's transaction; return the rows copied.
+
+    Holds the write lock for the whole copy, so only for small tables.
+    """
+    conn.execute(f"DROP TABLE IF EXISTS {table}__new")
+    conn.execute(_create_sql(table))
+    new_cols = {row[1] for row in _columns(conn, f"{table}__new")}
+    cols = [row[1] for row in _columns(conn, table) if row[1] in new_cols]
+    copied = conn.execute(
+        f"INSERT INTO {table}__new({', '.join(cols)}) "
+        f"SELECT {', '.join(_expr(table, c) for c in cols)} FROM {table}"
+    ).rowcount
+    _replace(conn, table)
+    return copied
+
+
+def small_enough(conn, tables, limit: int = None) -> bool:
+    """True if ``tables`` hold at most ``limit`` rows together and no online run is half done."""
+    limit = INLINE_MAX_ROWS if limit is None else limit
+    if any(_exists(conn, f"{table}__new") for table in tables):
+        return False
+    rows = 0
+    for table in tables:
+        # Capped so a huge table isn't counted in full
+        rows += conn.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM {table} LIMIT ?)", (limit + 1,)
+        ).fetchone()[0]
+        if rows > limit:
+            return False
+    return True
+
+
+def fix_text_values(conn, table: str) -> int:
+    """Convert TEXT values left in an already converted table; return the rows fixed.
+
+    They appear when a bot that predates the conversion kept writing after the
+    swap. Scans the whole table, so it belongs in ``migrate_ints.py``, not startup.
+    """
+    fixed = 0
+    for col in CONVERSIONS[table]:
+        fixed += conn.execute(
+            f"UPDATE {table} SET {col} = {_expr(table, col)} WHERE typeof({col}) = 'text'"
+        ).rowcount
+    conn.commit()
+    return fixed
+
+
+def migrate_table(conn, table: str, batch_size: int = 5000, pause: float = 0.0, log=print,
+                  swap: bool = True) -> int:
+    """Convert one table; return the number of rows copied by batches.
+
+    With ``swap=False`` the rows are copied and kept in sync but the old table
+    stays in place, so the old bot can run until it is stopped for the swap.
+    """
+    cols, keys = _prepare(conn, table)
+    copied = 0
+    while True:
+        n = _copy_batch(conn, table, cols, keys, batch_size)
+        if not n:
+            break
+        copied += n
+        if pause:
+            time.sleep(pause)
+    if not swap:
+        log(f"🔢 Copied {table} ({copied} rows); swap pending")
+        return copied
+    _swap(conn, table)
+    log(f"🔢 Converted {table} to integer ids/timestamps ({copied} rows)")
+    return copied
+
+
+def migrate_to_integers(conn, batch_size: int = 5000, pause: float = 0.0, log=print,
+                        swap: bool = True):
+    """Convert every pending table; safe to re-run and to interrupt."""
+    tables = pending_tables(conn)
+    for table in tables:
+        migrate_table(conn, table, batch_size, pause, log, swap)
+    return tables
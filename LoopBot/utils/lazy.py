@@ -0,0 +1,85 @@
+"""
+Deferred imports and startup timing.
+
+Heavy dependencies that only a few commands need (openai, the agents SDK,
+bs4, PIL) are imported on first use through :func:`load`, which caches the
+module and records how long its import took; :func:`openai_client` and
+:func:`ai_trace` build on it for the AI calls. :class:`StartupProfile` marks
+named startup phases and reports their durations with the peak RSS, for
+``python bot.py profile`` and ``STARTUP_PROFILE=1``.
+"""
+
+import contextlib
+import functools
+import importlib
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# module name -> seconds its first import took
+import_times = {}
+
+
+@functools.lru_cache(maxsize=None)
+def load(name: str):
+    """Import ``name`` on first call; later calls return the cached module."""
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    import_times[name] = time.perf_counter() - started
+    return module
+
+
+@functools.lru_cache(maxsize=None)
+def openai_client():
+    """OpenAI client for the v1.x API, created on first use (sync methods run via asyncio.to_thread)."""
+    return load('openai').OpenAI()
+
+
+def ai_trace(name: str = "LoopBot"):
+    """Agents SDK trace for one AI request, or a no-op when tracing is disabled.
+
+    Entered around each AI call rather than the whole run, so the SDK (and
+    openai with it) is only imported once a command actually needs AI.
+    """
+    if os.getenv('OPENAI_AGENTS_DISABLE_TRACING', '').lower() in ('1', 'true'):
+        return contextlib.nullcontext()
+    return load('agents').trace(name)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class StartupProfile:
+    """Wall-clock time per named startup phase."""
+
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.phases = []
+
+    def mark(self, phase: str):
+        """End the current phase, naming it ``phase``."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self) -> str:
+        lines = [f"  {phase:<12} {secs * 1000:8.1f} ms" for phase, secs in self.phases]
+        lines.append(f"  {'total':<12} {(self._last - self.started) * 1000:8.1f} ms")
+        if import_times:
+            lazy = ', '.join(f"{name} {secs * 1000:.0f} ms" for name, secs in import_times.items())
+            lines.append(f"  deferred imports so far: {lazy}")
+        rss = peak_rss_mb()
+        if rss is not None:
+            lines.append(f"  peak RSS     {rss:8.1f} MiB")
+        return "⏱️ Startup profile:\n" + "\n".join(lines)
@@ -0,0 +1,209 @@
+"""
+Leaderboard helpers.
+
+``rankings`` is mirrored in memory as a list kept sorted by points, so the
+top N can be sliced off without an ``ORDER BY`` over the whole table. Every
+points change goes through :func:`add_points` (inside a DB transaction) and
+the new total is then pushed into the in-memory index with ``Leaderboard.set``.
+Because the list is sorted, a user's position, the gap to the next user and
+the neighbourhood around them are all found by bisection in O(log n).
+
+Points follow one rule, which :func:`recompute_points` can rebuild from the
+underlying data: ``SUBMISSION_POINTS`` per audio/link submission plus
+``VOTE_POINTS`` per positive vote from another member on any of a
+submission's messages, counted once its voting window has closed and been
+settled (``vote_results``, see ``utils.votes.settle_closed``).
+"""
+
+import bisect
+
+SUBMISSION_POINTS = 1
+VOTE_POINTS = 1
+
+# Sorts before every user id in a (-points, user_id) entry
+_FIRST = float('-inf')
+
+
+def add_points(conn, user_id: int, delta: int) -> int:
+    """Add ``delta`` points to ``user_id`` in rankings and return the new total."""
+    conn.execute(
+        "INSERT INTO rankings(user_id, points) VALUES(?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET points = COALESCE(points, 0) + excluded.points",
+        (user_id, delta),
+    )
+    return conn.execute(
+        "SELECT points FROM rankings WHERE user_id = ?", (user_id,)
+    ).fetchone()[0]
+
+
+class Leaderboard:
+    """In-memory sorted index over ``rankings``.
+
+    Entries are ``(-points, user_id)`` tuples in ascending order, i.e. highest
+    points first with ties broken by user id. Excluded users (the bot itself)
+    are tracked but never enter the index.
+    """
+
+    def __init__(self):
+        self._points = {}
+        self._sorted = []
+        self._excluded = set()
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._sorted)
+
+    async def load(self, db):
+        """Rebuild the index from the rankings table."""
+        rows = await db.fetchall(
+            "SELECT user_id, COALESCE(points, 0) FROM rankings"
+        )
+        self._points = {uid: pts for uid, pts in rows}
+        self._sorted = sorted(
+            (-pts, uid) for uid, pts in self._points.items() if uid not in self._excluded
+        )
+        self.loaded = True
+        return len(self._sorted)
+
+    def exclude(self, user_id: int):
+        """Keep ``user_id`` out of every ranking (e.g. the bot user)."""
+        self._excluded.add(user_id)
+        self._remove(user_id)
+
+    def _remove(self, user_id: int):
+        pts = self._points.get(user_id)
+        if pts is None:
+            return
+        i = bisect.bisect_left(self._sorted, (-pts, user_id))
+        if i < len(self._sorted) and self._sorted[i] == (-pts, user_id):
+            del self._sorted[i]
+
+    def set(self, user_id: int, points: int):
+        """Record a user's new point total (call after the rankings upsert commits)."""
+        self._remove(user_id)
+        self._points[user_id] = points
+        if user_id not in self._excluded:
+            bisect.insort(self._sorted, (-points, user_id))
+
+    def points(self, user_id: int) -> int:
+        """Return a user's point total (0 if unranked)."""
+        return self._points.get(user_id, 0)
+
+    def top(self, n: int = 5):
+        """Return the top ``n`` entries as ``(user_id, points)`` tuples."""
+        return [(uid, -neg) for neg, uid in self._sorted[:n]]
+
+    def position(self, user_id: int):
+        """Return ``(position, total, points)`` for a ranked user, or None.
+
+        Position is competition style: one plus the number of users with
+        strictly more points, found by bisecting the sorted index.
+        """
+        if user_id in self._excluded or user_id not in self._points:
+            return None
+        pts = self._points[user_id]
+        # -inf sorts before every user id, so this counts entries with more points
+        ahead = bisect.bisect_left(self._sorted, (-pts, _FIRST))
+        return ahead + 1, len(self._sorted), pts
+
+    def next_above(self, user_id: int):
+        """Return ``(user_id, points)`` of the closest user with more points, or None."""
+        pts = self._points.get(user_id)
+        if pts is None:
+            return None
+        ahead = bisect.bisect_left(self._sorted, (-pts, _FIRST))
+        if ahead == 0:
+            return None
+        neg, uid = self._sorted[ahead - 1]
+        return uid, -neg
+
+    def around(self, user_id: int, radius: int = 2):
+        """Return up to ``radius`` entries either side of a user as ``(position, user_id, points)``."""
+        pts = self._points.get(user_id)
+        if pts is None or user_id in self._excluded:
+            return []
+        i = bisect.bisect_left(self._sorted, (-pts, user_id))
+        lo = max(0, i - radius)
+        return [
+            (bisect.bisect_left(self._sorted, (neg, _FIRST)) + 1, uid, -neg)
+            for neg, uid in self._sorted[lo:i + radius + 1]
+        ]
+
+
+# Derived points per user, streamed in user_id order. Votes resolve to their
+# submission (and author) through submission_index.
+_DERIVED_POINTS = """
+SELECT author, SUM(pts) FROM (
+    SELECT user_id AS author, :sub_pts AS pts FROM audio_submissions
+    UNION ALL
+    SELECT user_id, :sub_pts FROM link_submissions
+    UNION ALL
+    SELECT COALESCE(a.user_id, l.user_id, m.author_id), :vote_pts
+    FROM message_votes v
+    JOIN vote_results vr ON vr.message_id = v.message_id
+    JOIN submission_index si ON si.message_id = v.message_id
+    LEFT JOIN audio_submissions a ON si.kind = 'audio' AND a.id = si.submission_id
+    LEFT JOIN link_submissions l ON si.kind = 'link' AND l.id = si.submission_id
+    LEFT JOIN messages m ON si.kind = 'message' AND m.message_id = si.submission_id
+    WHERE v.score > 0
+      AND v.voter_id IS NOT COALESCE(a.user_id, l.user_id, m.author_id)
+)
+WHERE author IS NOT NULL
+GROUP BY author ORDER BY author
+"""
+
+
+def _points_diff(conn):
+    """Merge derived points with rankings (both in user_id order) in one pass.
+
+    Returns ``(checked, [(user_id, delta), ...])`` for every user whose stored
+    total differs from the derived one.
+    """
+    conn.execute("BEGIN")
+    try:
+        derived = conn.execute(
+            _DERIVED_POINTS, {'sub_pts': SUBMISSION_POINTS, 'vote_pts': VOTE_POINTS}
+        )
+        stored = conn.execute(
+            "SELECT user_id, COALESCE(points, 0) FROM rankings ORDER BY user_id"
+        )
+        d, r = next(derived, None), next(stored, None)
+        checked, diff = 0, []
+        while d or r:
+            checked += 1
+            if r is None or (d and d[0] < r[0]):
+                uid, want, have = d[0], d[1], 0
+                d = next(derived, None)
+            elif d is None or r[0] < d[0]:
+                uid, want, have = r[0], 0, r[1]
+                r = next(stored, None)
+            else:
+                uid, want, have = d[0], d[1], r[1]
+                d, r = next(derived, None), next(stored, None)
+            if want != have:
+                diff.append((uid, want - have))
+        return checked, diff
+    finally:
+        conn.execute("COMMIT")
+
+
+def _apply_diff(conn, diff):
+    # Deltas, not absolute totals: points awarded since the read snapshot stay
+    conn.executemany(
+        "INSERT INTO rankings(user_id, points) VALUES(?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET points = COALESCE(points, 0) + excluded.points",
+        diff,
+    )
+
+
+async def recompute_points(db):
+    """Rebuild rankings from submissions and votes and correct any drift.
+
+    The derivation streams on a reader (one consistent snapshot, merged
+    against rankings in user_id order); only the differences are written,
+    as deltas, in one transaction. Returns ``(checked, corrected)``.
+    """
+    checked, diff = await db.read(_points_diff)
+    if diff:
+        await db.transaction(_apply_diff, diff)
+    return checked, len(diff)
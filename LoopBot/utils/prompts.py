@@ -1,8 +1,113 @@
 """
 Prompt templates and helper functions.
+
+Daily prompts are generated ahead of time into ``prompt_buffer`` so posting
+never waits on the model: :func:`refill` tops the buffer up to a target
+depth from a background task and :func:`pop_prompt` takes the oldest entry
+when a post is due. Each refill records its timing in ``meta`` for
+:func:`buffer_status`. :func:`generate_ai_prompt` is the generator both the
+bot and ``cron.py daily`` refill with.
 """
 
-def get_prompt(name: str) -> str:
-    """Retrieve a prompt template by name."""
-    # TODO: implement prompt retrieval logic
-    return ""
+import asyncio
+import json
+import time
+
+from .db import get_meta, now_ms, set_meta
+from .lazy import ai_trace, openai_client
+
+# meta key: {"at", "seconds", "added", "depth", "ok"} of the latest refill
+REFILL_STATUS = 'prompt_refill'
+
+# Used only when the buffer has run dry
+FALLBACK_PROMPTS = [
+    "🌿 Create a loop inspired by nature's rhythm.",
+    "💭 Make something based on a dream you had.",
+    "🚀 Design a sound/scene/story from the future.",
+    "🌀 Loop based on the feeling of déjà vu.",
+    "🔥 Create something chaotic, messy, raw."
+]
+
+
+async def generate_ai_prompt():
+    """Ask GPT for one daily challenge prompt; None on any error."""
+    try:
+        # Shared openai v1.x client, created on first use; its sync call runs in a thread
+        with ai_trace():
+            data = await asyncio.to_thread(
+                openai_client().chat.completions.create,
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": (
+                        "You are a creative challenge bot. Provide concise, vivid, and self-contained prompts "
+                        "in complete sentences that inspire music, art, or storytelling."
+                    )},
+                    {"role": "user", "content": (
+                        "Please give me a creative challenge prompt: one or two clear, vivid sentences."
+                    )}
+                ],
+                max_tokens=100,
+                temperature=0.7,
+                frequency_penalty=0.5,
+                presence_penalty=0.0,
+            )
+        return data.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"[❌] OpenAI error: {e}")
+        return None
+
+
+def push_prompt(conn, prompt: str, ts: int):
+    """Append a generated prompt to the buffer."""
+    conn.execute("INSERT INTO prompt_buffer(prompt, created_at) VALUES(?, ?)", (prompt, ts))
+
+
+def pop_prompt(conn):
+    """Remove and return the oldest buffered prompt, or None if the buffer is empty."""
+    row = conn.execute("SELECT id, prompt FROM prompt_buffer ORDER BY id LIMIT 1").fetchone()
+    if not row:
+        return None
+    conn.execute("DELETE FROM prompt_buffer WHERE id = ?", (row[0],))
+    return row[1]
+
+
+def _depth(conn) -> int:
+    return conn.execute("SELECT COUNT(*) FROM prompt_buffer").fetchone()[0]
+
+
+async def refill(db, generate, target: int) -> int:
+    """Generate prompts until ``target`` are buffered; return how many were added.
+
+    ``generate`` is a coroutine returning a prompt, or None on failure (which
+    ends this refill early; the next one tries again).
+    """
+    started = time.perf_counter()
+    depth = await db.read(_depth)
+    added, ok = 0, True
+    while depth + added < target:
+        prompt = await generate()
+        if not prompt:
+            ok = False
+            break
+        await db.transaction(push_prompt, prompt, now_ms())
+        added += 1
+    status = {
+        'at': now_ms(),
+        'seconds': round(time.perf_counter() - started, 2),
+        'added': added,
+        'depth': depth + added,
+        'ok': ok,
+    }
+    await db.transaction(set_meta, REFILL_STATUS, json.dumps(status))
+    return added
+
+
+def _status(conn) -> dict:
+    status = json.loads(get_meta(conn, REFILL_STATUS, 'null') or 'null') or {}
+    status['depth'] = _depth(conn)
+    return status
+
+
+async def buffer_status(db) -> dict:
+    """Current buffer depth plus the latest refill's ``at``/``seconds``/``added``/``ok``."""
+    return await db.read(_status)
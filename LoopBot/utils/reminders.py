@@ -0,0 +1,113 @@
+"""
+Daily DM reminder dispatch.
+
+:func:`dispatch` walks ``reminders`` in user id order, a chunk at a time, and
+sends up to ``concurrency`` DMs at once. Starts are paced to ``rate`` per
+second across all workers; when Discord answers 429 anyway the send callback
+raises :class:`RateLimited` and every worker holds off for ``retry_after``.
+discord.py already honours the per-route bucket headers; the pacer keeps a
+large fan-out under the global limit instead of discovering it by 429s.
+
+Progress (day, last user id, counts) is checkpointed in ``meta`` after every
+chunk, so a crash mid-run resumes after the last finished chunk instead of
+re-sending everyone's reminder.
+"""
+
+import asyncio
+import json
+import time
+
+from .db import get_meta, set_meta
+
+SENT = 'sent'
+FAILED = 'failed'
+BLOCKED = 'blocked'
+
+# meta key: {"day", "after", "done", "sent", "failed", "blocked"} of the latest run
+REMINDER_PROGRESS = 'reminder_progress'
+
+
+class RateLimited(Exception):
+    """Raised by a send callback when Discord rate-limited the request."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"rate limited for {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class Pacer:
+    """Spaces out request starts to ``rate`` per second, shared by all workers."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            delay = self._next - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next = max(self._next, time.monotonic()) + self.interval
+
+    def hold(self, seconds: float):
+        """Push the next start at least ``seconds`` into the future."""
+        self._next = max(self._next, time.monotonic() + seconds)
+
+
+def _load(conn, day: str) -> dict:
+    state = json.loads(get_meta(conn, REMINDER_PROGRESS, 'null') or 'null')
+    if not state or state.get('day') != day:
+        state = {'day': day, 'after': 0, 'done': False, SENT: 0, FAILED: 0, BLOCKED: 0}
+    return state
+
+
+def _save(conn, state: dict):
+    set_meta(conn, REMINDER_PROGRESS, json.dumps(state))
+
+
+async def progress(db, day: str) -> dict:
+    """Progress of the run for ``day`` (zeroed if it hasn't started)."""
+    return await db.read(_load, day)
+
+
+async def dispatch(db, send, day: str, concurrency: int = 5, rate: float = 5.0,
+                   chunk: int = 50, retries: int = 3) -> dict:
+    """Send ``day``'s reminder to every subscriber not reached yet.
+
+    ``send(user_id)`` is a coroutine returning ``SENT``, ``FAILED`` or
+    ``BLOCKED`` (DMs closed), or raising :class:`RateLimited`. A finished run
+    for the same day is not repeated. Returns the progress dict with counts.
+    """
+    state = await progress(db, day)
+    if state['done']:
+        return state
+    sem = asyncio.Semaphore(concurrency)
+    pacer = Pacer(rate)
+
+    async def deliver(user_id):
+        async with sem:
+            for _ in range(retries):
+                await pacer.wait()
+                try:
+                    return await send(user_id)
+                except RateLimited as e:
+                    pacer.hold(e.retry_after)
+                except Exception as e:
+                    print(f"⚠️ Reminder to {user_id} failed: {e}")
+                    return FAILED
+            return FAILED
+
+    while True:
+        rows = await db.fetchall(
+            "SELECT user_id FROM reminders WHERE user_id > ? ORDER BY user_id LIMIT ?",
+            (state['after'], chunk),
+        )
+        for outcome in await asyncio.gather(*(deliver(uid) for uid, in rows)):
+            state[outcome if outcome in (SENT, BLOCKED) else FAILED] += 1
+        if rows:
+            state['after'] = rows[-1][0]
+        state['done'] = len(rows) < chunk
+        await db.transaction(_save, state)
+        if state['done']:
+            return state
@@ -0,0 +1,142 @@
+"""
+Submission search helpers.
+
+Tag search runs against the ``submission_tags`` inverted index: each term is
+an exact tag (``#art``) or a prefix (``#beat*``), terms are combined with AND
+(default) or OR, and results are keyset-paginated newest first so a page
+never costs more than ``limit`` rows.
+
+Free-text search (``!find``) uses the ``submission_fts`` FTS5 table, which
+triggers keep in sync with link bodies and attachment filenames; results are
+ordered by BM25 rank.
+"""
+
+PAGE_SIZE = 10
+
+# Cursor tokens look like "a12" / "l7": kind initial + submission id
+_KIND_CODES = {'audio': 'a', 'link': 'l'}
+_CODE_KINDS = {v: k for k, v in _KIND_CODES.items()}
+
+
+def parse_tag_query(words):
+    """Parse ``!search`` arguments into ``(terms, mode, cursor)``.
+
+    ``terms`` is a list of ``(tag, is_prefix)``; ``mode`` is ``'and'`` unless an
+    ``or`` / ``|`` separator appears; ``cursor`` comes from a ``next:<token>`` word.
+    """
+    terms, mode, cursor = [], 'and', None
+    for word in words:
+        low = word.lower()
+        if low in ('or', '|'):
+            mode = 'or'
+        elif low == 'and':
+            continue
+        elif low.startswith('next:'):
+            cursor = word[5:]
+        else:
+            tag = low.lstrip('#')
+            prefix = tag.endswith('*')
+            tag = tag.rstrip('*')
+            if tag and (tag, prefix) not in terms:
+                terms.append((tag, prefix))
+    return terms, mode, cursor
+
+
+def encode_cursor(kind: str, submission_id: int) -> str:
+    return f"{_KIND_CODES[kind]}{submission_id}"
+
+
+def _term_sql(tag: str, prefix: bool):
+    if prefix:
+        # Half-open range keeps the prefix scan on the (tag, ...) index
+        return (
+            "SELECT DISTINCT kind, submission_id, timestamp FROM submission_tags WHERE tag >= ? AND tag < ?",
+            [tag, tag + '\U0010ffff'],
+        )
+    return "SELECT DISTINCT kind, submission_id, timestamp FROM submission_tags WHERE tag = ?", [tag]
+
+
+def _search(conn, terms, mode, cursor, limit):
+    parts, params = [], []
+    for tag, prefix in terms:
+        sql, args = _term_sql(tag, prefix)
+        parts.append(sql)
+        params.extend(args)
+    hits = (' INTERSECT ' if mode == 'and' else ' UNION ').join(parts)
+    where = ''
+    if cursor:
+        kind, sub_id = _CODE_KINDS.get(cursor[:1]), cursor[1:]
+        row = None
+        if kind and sub_id.isdigit():
+            row = conn.execute(
+                "SELECT timestamp FROM submission_tags WHERE kind = ? AND submission_id = ? LIMIT 1",
+                (kind, int(sub_id)),
+            ).fetchone()
+        if not row:
+            return [], None
+        where = "WHERE (h.timestamp, h.kind, h.submission_id) < (?, ?, ?)"
+        params.extend([row[0], kind, int(sub_id)])
+    rows = conn.execute(
+        f"WITH hits AS ({hits}) "
+        "SELECT h.kind, h.submission_id, h.timestamp, "
+        "COALESCE(a.user_id, l.user_id), COALESCE(a.filename, l.link) "
+        "FROM hits h "
+        "LEFT JOIN audio_submissions a ON h.kind = 'audio' AND a.id = h.submission_id "
+        "LEFT JOIN link_submissions l ON h.kind = 'link' AND l.id = h.submission_id "
+        f"{where} "
+        "ORDER BY h.timestamp DESC, h.kind DESC, h.submission_id DESC LIMIT ?",
+        params + [limit + 1],
+    ).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][0], rows[-1][1])
+    return rows, next_cursor
+
+
+async def search_tags(db, terms, mode: str = 'and', cursor: str = None, limit: int = PAGE_SIZE):
+    """Return ``(rows, next_cursor)`` for a tag query.
+
+    Each row is ``(kind, submission_id, timestamp, user_id, content)``; ``next_cursor``
+    is None on the last page.
+    """
+    if not terms:
+        return [], None
+    return await db.read(_search, terms, mode, cursor, limit)
+
+
+def build_fts_query(text: str) -> str:
+    """Turn free text into a safe FTS5 query: every word quoted, the last one as a prefix."""
+    words = [w.replace('"', '""') for w in text.split() if w.strip('"')]
+    if not words:
+        return ''
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _find(conn, match, limit, offset):
+    return conn.execute(
+        "SELECT f.rowid % 2, f.rowid / 2, "
+        "COALESCE(a.user_id, l.user_id), COALESCE(a.filename, l.link), "
+        "COALESCE(a.timestamp, l.timestamp) "
+        "FROM submission_fts f "
+        "LEFT JOIN audio_submissions a ON f.rowid % 2 = 1 AND a.id = f.rowid / 2 "
+        "LEFT JOIN link_submissions l ON f.rowid % 2 = 0 AND l.id = f.rowid / 2 "
+        "WHERE submission_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+        (match, limit + 1, offset),
+    ).fetchall()
+
+
+async def find_submissions(db, text: str, page: int = 1, limit: int = PAGE_SIZE):
+    """Full-text search over link bodies and filenames, best matches first.
+
+    Returns ``(rows, has_more)`` where each row is
+    ``(kind, submission_id, user_id, content, timestamp)``.
+    """
+    match = build_fts_query(text)
+    if not match:
+        return [], False
+    rows = await db.read(_find, match, limit, (max(page, 1) - 1) * limit)
+    rows = [('audio' if odd else 'link', sub_id, *rest) for odd, sub_id, *rest in rows]
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,229 @@
+"""
+Submission registry helpers.
+
+Every submission can be reached from any Discord message that represents it
+(the voting-hall post, the member's original message, or a raw attachment post
+in the submissions channel) through ``submission_index``, which is keyed by
+message id. Vote paths resolve a message with a single primary-key lookup.
+
+The write helpers take a sqlite3 connection and are meant to run inside
+``Database.transaction`` so the submission row and its index entries commit
+together. ``VoteWindowCache`` keeps the message ids whose voting window is
+still open in memory, so reactions on closed or unknown messages are rejected
+without a query.
+
+``submission_media`` caches each submission message's jump URL and first
+attachment (CDN URL, content type, size) when it is posted, so summaries can
+be built without fetching messages. Discord CDN URLs are signed and expire;
+their expiry (the ``ex`` query parameter) is stored alongside.
+"""
+
+import heapq
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from .db import now_ms
+
+KIND_MESSAGE = 'message'
+KIND_AUDIO = 'audio'
+KIND_LINK = 'link'
+
+# kind -> (table, content column)
+_TABLES = {
+    KIND_AUDIO: ('audio_submissions', 'filename'),
+    KIND_LINK: ('link_submissions', 'link'),
+}
+
+
+def normalize_tags(tags) -> list:
+    """Split a space-separated tag string into unique lowercase tags without ``#``."""
+    out = []
+    for tag in (tags or '').split():
+        tag = tag.lstrip('#').lower()
+        if tag and tag not in out:
+            out.append(tag)
+    return out
+
+
+def index_tags(conn, kind: str, submission_id: int, tags: str, timestamp: int):
+    """Add a submission's tags to the submission_tags inverted index."""
+    conn.executemany(
+        "INSERT OR IGNORE INTO submission_tags(tag, kind, submission_id, timestamp) VALUES(?,?,?,?)",
+        [(tag, kind, submission_id, timestamp) for tag in normalize_tags(tags)],
+    )
+
+
+def cdn_expiry(url: str):
+    """Epoch ms at which a signed Discord CDN URL expires, or None if it doesn't."""
+    ex = parse_qs(urlsplit(url or '').query).get('ex')
+    try:
+        return int(ex[0], 16) * 1000 if ex else None
+    except ValueError:
+        return None
+
+
+def record_media(conn, media):
+    """Store ``(message_id, channel_id, jump_url, url, content_type, size)`` rows."""
+    conn.executemany(
+        "INSERT OR REPLACE INTO submission_media"
+        "(message_id, channel_id, jump_url, url, content_type, size, expires_at) "
+        "VALUES(?,?,?,?,?,?,?)",
+        [(*row, cdn_expiry(row[3])) for row in media],
+    )
+
+
+def refresh_media_urls(conn, urls):
+    """Replace expired attachment URLs from ``(message_id, url)`` pairs."""
+    conn.executemany(
+        "UPDATE submission_media SET url = ?, expires_at = ? WHERE message_id = ?",
+        [(url, cdn_expiry(url), message_id) for message_id, url in urls],
+    )
+
+
+def stale_media(media, margin_ms: int = 10 * 60 * 1000):
+    """``(message_id, channel_id)`` of ``media_for`` entries whose URL expires within ``margin_ms``."""
+    soon = now_ms() + margin_ms
+    return [
+        (msg_id, row[0]) for msg_id, row in media.items()
+        if row[2] and row[5] is not None and row[5] <= soon
+    ]
+
+
+def apply_fresh_urls(media, urls):
+    """Swap refreshed ``(message_id, url)`` pairs into a ``media_for`` mapping."""
+    for msg_id, url in urls:
+        row = media[msg_id]
+        media[msg_id] = (*row[:2], url, *row[3:5], cdn_expiry(url))
+
+
+async def media_for(db, message_ids):
+    """Map message id -> ``(channel_id, jump_url, url, content_type, size, expires_at)``."""
+    ids = list(message_ids)
+    if not ids:
+        return {}
+    rows = await db.fetchall(
+        "SELECT message_id, channel_id, jump_url, url, content_type, size, expires_at "
+        f"FROM submission_media WHERE message_id IN ({', '.join('?' * len(ids))})",
+        ids,
+    )
+    return {row[0]: row[1:] for row in rows}
+
+
+def register(conn, kind: str, submission_id: int, timestamp: int, *message_ids):
+    """Point each of ``message_ids`` at a submission (existing entries are kept)."""
+    conn.executemany(
+        "INSERT OR IGNORE INTO submission_index(message_id, kind, submission_id, timestamp) "
+        "VALUES(?,?,?,?)",
+        [(mid, kind, submission_id, timestamp) for mid in message_ids if mid],
+    )
+
+
+def record_message(conn, message_id: int, channel_id: int, author_id: int, timestamp: int,
+                   media=()):
+    """Record a raw submissions-channel message and make it votable."""
+    conn.execute(
+        "INSERT OR IGNORE INTO messages(message_id, channel_id, author_id, timestamp) VALUES(?,?,?,?)",
+        (message_id, channel_id, author_id, timestamp),
+    )
+    register(conn, KIND_MESSAGE, message_id, timestamp, message_id)
+    record_media(conn, media)
+
+
+def add_submission(conn, kind: str, user_id: int, content: str, timestamp: int,
+                   tags: str, orig_message_id: int, message_id: int = None, media=()) -> int:
+    """Insert an audio/link submission, index its message ids and tags, and return its row id.
+
+    ``media`` holds :func:`record_media` rows for the submission's messages.
+    """
+    table, column = _TABLES[kind]
+    sub_id = conn.execute(
+        f"INSERT INTO {table} (user_id, {column}, timestamp, tags, orig_message_id, message_id) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (user_id, content, timestamp, tags, orig_message_id, message_id),
+    ).lastrowid
+    register(conn, kind, sub_id, timestamp, message_id, orig_message_id)
+    index_tags(conn, kind, sub_id, tags, timestamp)
+    record_media(conn, media)
+    return sub_id
+
+
+def set_message_id(conn, kind: str, submission_id: int, message_id: int, timestamp: int,
+                   media=()):
+    """Attach the voting-hall message id to an existing submission."""
+    table, _ = _TABLES[kind]
+    conn.execute(f"UPDATE {table} SET message_id = ? WHERE id = ?", (message_id, submission_id))
+    register(conn, kind, submission_id, timestamp, message_id)
+    record_media(conn, media)
+
+
+async def lookup(db, message_id: int):
+    """Return ``(kind, submission_id, timestamp)`` for a message id, or None."""
+    return await db.fetchone(
+        "SELECT kind, submission_id, timestamp FROM submission_index WHERE message_id = ?",
+        (message_id,),
+    )
+
+
+class VoteWindowCache:
+    """In-memory index of submissions still inside their voting window.
+
+    Maps message id -> window close time (epoch seconds). A min-heap of close
+    times lets ``evict`` drop expired entries without scanning the map.
+    Submission timestamps are epoch milliseconds.
+    """
+
+    def __init__(self, window_hours: float):
+        self.window = window_hours * 3600
+        self._closes = {}
+        self._heap = []
+
+    def __len__(self):
+        return len(self._closes)
+
+    def __contains__(self, message_id):
+        return message_id in self._closes
+
+    def add(self, message_id: int, opened_at: int):
+        """Open voting on ``message_id`` for the window starting at ``opened_at`` (epoch ms)."""
+        if not message_id:
+            return
+        closes = opened_at / 1000 + self.window
+        if closes <= time.time():
+            return
+        self._closes[message_id] = closes
+        heapq.heappush(self._heap, (closes, message_id))
+
+    def is_open(self, message_id: int, now: float = None) -> bool:
+        """Return True if votes on ``message_id`` are currently accepted."""
+        closes = self._closes.get(message_id)
+        return closes is not None and closes > (time.time() if now is None else now)
+
+    def next_close(self):
+        """Epoch seconds at which the next window closes, or None."""
+        return self._heap[0][0] if self._heap else None
+
+    def evict(self, now: float = None) -> int:
+        """Drop every entry whose window has closed; return how many were removed."""
+        now = time.time() if now is None else now
+        removed = 0
+        while self._heap and self._heap[0][0] <= now:
+            closes, message_id = heapq.heappop(self._heap)
+            # Skip stale heap entries superseded by a later add()
+            if self._closes.get(message_id) == closes:
+                del self._closes[message_id]
+                removed += 1
+        return removed
+
+    async def load(self, db) -> int:
+        """Rebuild the cache from submission_index (call from on_ready)."""
+        since = now_ms() - int(self.window * 1000)
+        # Integer range scan on idx_submission_index_ts
+        rows = await db.fetchall(
+            "SELECT message_id, timestamp FROM submission_index WHERE timestamp >= ?",
+            (since,),
+        )
+        self._closes.clear()
+        self._heap.clear()
+        for message_id, ts in rows:
+            self.add(message_id, ts)
+        return len(self)
@@ -0,0 +1,287 @@
+"""
+Bulk export/import of LoopBot tables.
+
+An export is a directory with one ``<table>.jsonl`` (one JSON object per
+line, like ``requests.jsonl``) or ``<table>.csv`` file per table plus a
+``manifest.json``. Rows are streamed with ``fetchmany`` and written line by
+line, and imports read them back in chunks fed to ``executemany``, so memory
+use does not grow with table size. The whole export reads from one
+read transaction, i.e. a single consistent snapshot of a live database.
+
+The manifest records, per table, a SHA-256 over the rows in primary-key
+order (``sha256``) and over the written file (``file_sha256``); ``verify``
+recomputes both. CSV files write NULL as ``\\N``.
+"""
+
+import csv
+import hashlib
+import itertools
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+from urllib.request import pathname2url
+
+from .db import SCHEMA, setup_db, to_ms
+
+FORMATS = ('jsonl', 'csv')
+
+# table -> (time column, unit) used by --since / --until
+TIME_COLUMNS = {
+    'audio_submissions': ('timestamp', 'ms'),
+    'link_submissions': ('timestamp', 'ms'),
+    'votes': ('timestamp', 'ms'),
+    'users': ('last_xp_ts', 'ms'),
+    'xp_events': ('ts', 'ms'),
+    'messages': ('timestamp', 'ms'),
+    'message_votes': ('ts', 'ms'),
+    'submission_index': ('timestamp', 'ms'),
+    'submission_tags': ('timestamp', 'ms'),
+    'xp_daily': ('day', 'day'),
+    'vote_buckets': ('hour', 'hour'),
+    'vote_results': ('closed_at', 'ms'),
+    'prompt_buffer': ('created_at', 'ms'),
+}
+
+
+# Per-database migration bookkeeping and FTS5 availability stay out of exports
+_SKIP_ROWS = {
+    'meta': "key NOT LIKE 'bgmigrate:%' AND key NOT LIKE 'intmigrate:%' AND key != 'fts_available'",
+}
+CSV_NULL = '\\N'
+
+
+def parse_time(value):
+    """Parse an ISO date/datetime (UTC if naive) or integer epoch ms; None passes through."""
+    if value is None or isinstance(value, int):
+        return value
+    if str(value).isdigit():
+        return int(value)
+    return to_ms(datetime.fromisoformat(value))
+
+
+def table_names(conn):
+    """Tables from SCHEMA that exist in ``conn``, in creation order."""
+    existing = {
+        row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+    names = []
+    for stmt in SCHEMA:
+        m = re.match(r"CREATE TABLE IF NOT EXISTS (\w+)", stmt)
+        if m and m.group(1) in existing:
+            names.append(m.group(1))
+    return names
+
+
+def _columns(conn, table: str):
+    info = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    keys = [row[1] for row in sorted(info, key=lambda r: r[5]) if row[5]]
+    return [row[1] for row in info], keys
+
+
+def _where(table: str, since, until):
+    clauses, params = [], []
+    if table in _SKIP_ROWS:
+        clauses.append(_SKIP_ROWS[table])
+    column, unit = TIME_COLUMNS.get(table, (None, None))
+    for op, bound in (('>=', since), ('<', until)):
+        if bound is None or column is None:
+            continue
+        if unit == 'day':
+            bound = datetime.fromtimestamp(bound / 1000, tz=timezone.utc).date().isoformat()
+        elif unit == 'hour':
+            bound = bound // 3600000
+        clauses.append(f"{column} {op} ?")
+        params.append(bound)
+    if not clauses:
+        return '', []
+    return 'WHERE ' + ' AND '.join(clauses), params
+
+
+def iter_rows(conn, table: str, since=None, until=None, chunk: int = 5000):
+    """Yield ``table``'s rows in primary-key order, ``chunk`` rows per fetch."""
+    columns, keys = _columns(conn, table)
+    where, params = _where(table, since, until)
+    cur = conn.execute(
+        f"SELECT {', '.join(columns)} FROM {table} {where} ORDER BY {', '.join(keys)}", params
+    )
+    while True:
+        rows = cur.fetchmany(chunk)
+        if not rows:
+            return
+        yield from rows
+
+
+def _row_bytes(row) -> bytes:
+    return json.dumps(list(row), ensure_ascii=False, separators=(',', ':')).encode() + b'\n'
+
+
+def table_checksum(conn, table: str, since=None, until=None, chunk: int = 5000):
+    """Return ``(rows, sha256)`` over a table's rows in primary-key order."""
+    digest, count = hashlib.sha256(), 0
+    for row in iter_rows(conn, table, since, until, chunk):
+        digest.update(_row_bytes(row))
+        count += 1
+    return count, digest.hexdigest()
+
+
+def _file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _connect_ro(path: str):
+    return sqlite3.connect(
+        f"file:{pathname2url(os.path.abspath(path))}?mode=ro", uri=True, isolation_level=None
+    )
+
+
+def export_data(db_path: str, dest: str, fmt: str = 'jsonl', since=None, until=None,
+                tables=None, chunk: int = 5000, log=print) -> dict:
+    """Stream tables from ``db_path`` into ``dest``; return the manifest."""
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt}")
+    since, until = parse_time(since), parse_time(until)
+    os.makedirs(dest, exist_ok=True)
+    conn = _connect_ro(db_path)
+    manifest = {
+        'format': fmt,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'since': since,
+        'until': until,
+        'tables': {},
+    }
+    try:
+        # One read transaction: every table comes from the same snapshot
+        conn.execute("BEGIN")
+        manifest['user_version'] = conn.execute("PRAGMA user_version").fetchone()[0]
+        for table in table_names(conn):
+            if tables and table not in tables:
+                continue
+            columns, _ = _columns(conn, table)
+            path = os.path.join(dest, f"{table}.{fmt}")
+            digest, count = hashlib.sha256(), 0
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f) if fmt == 'csv' else None
+                if writer:
+                    writer.writerow(columns)
+                for row in iter_rows(conn, table, since, until, chunk):
+                    digest.update(_row_bytes(row))
+                    count += 1
+                    if writer:
+                        writer.writerow([CSV_NULL if v is None else v for v in row])
+                    else:
+                        f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n')
+            manifest['tables'][table] = {
+                'columns': columns,
+                'rows': count,
+                'filtered': table in TIME_COLUMNS and (since is not None or until is not None),
+                'sha256': digest.hexdigest(),
+                'file_sha256': _file_checksum(path),
+            }
+            log(f"📤 {table}: {count} rows")
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    with open(os.path.join(dest, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(src: str) -> dict:
+    with open(os.path.join(src, 'manifest.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _read_file(path: str, fmt: str, columns):
+    """Yield tuples in ``columns`` order from an export file."""
+    with open(path, encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            reader = csv.reader(f)
+            header = next(reader, [])
+            idx = [header.index(c) if c in header else None for c in columns]
+            for rec in reader:
+                yield tuple(
+                    None if i is None or rec[i] == CSV_NULL else rec[i] for i in idx
+                )
+        else:
+            for line in f:
+                if line.strip():
+                    obj = json.loads(line)
+                    yield tuple(obj.get(c) for c in columns)
+
+
+def import_data(db_path: str, src: str, replace: bool = False, chunk: int = 5000, log=print) -> dict:
+    """Load an export directory into ``db_path``; return rows written per table.
+
+    Existing rows win unless ``replace`` is set. Each table is loaded in one
+    transaction, ``chunk`` rows per ``executemany`` call.
+    """
+    manifest = read_manifest(src)
+    fmt = manifest.get('format', 'jsonl')
+    conn = sqlite3.connect(db_path, timeout=30)
+    written = {}
+    try:
+        setup_db(conn)
+        if replace:
+            # REPLACE must fire delete triggers so submission_fts stays in sync
+            conn.execute("PRAGMA recursive_triggers = ON")
+        existing = set(table_names(conn))
+        for table, info in manifest['tables'].items():
+            path = os.path.join(src, f"{table}.{fmt}")
+            if table not in existing or not os.path.exists(path):
+                log(f"⚠️ Skipping {table}: not in this database or file missing")
+                continue
+            have, _ = _columns(conn, table)
+            columns = [c for c in info['columns'] if c in have]
+            sql = (
+                f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO {table}"
+                f"({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+            )
+            rows = _read_file(path, fmt, columns)
+            count = 0
+            with conn:
+                while True:
+                    batch = list(itertools.islice(rows, chunk))
+                    if not batch:
+                        break
+                    count += conn.executemany(sql, batch).rowcount
+            written[table] = count
+            log(f"📥 {table}: {count} of {info['rows']} rows written")
+    finally:
+        conn.close()
+    return written
+
+
+def verify(db_path: str, src: str, chunk: int = 5000, log=print) -> list:
+    """Check export files and ``db_path`` against the manifest; return the mismatches."""
+    manifest = read_manifest(src)
+    fmt = manifest.get('format', 'jsonl')
+    since, until = manifest.get('since'), manifest.get('until')
+    problems = []
+    conn = _connect_ro(db_path)
+    try:
+        conn.execute("BEGIN")
+        existing = set(table_names(conn))
+        for table, info in manifest['tables'].items():
+            path = os.path.join(src, f"{table}.{fmt}")
+            if not os.path.exists(path):
+                problems.append(f"{table}: export file missing")
+            elif _file_checksum(path) != info['file_sha256']:
+                problems.append(f"{table}: export file checksum mismatch")
+            if table not in existing:
+                problems.append(f"{table}: missing from database")
+                continue
+            count, digest = table_checksum(conn, table, since, until, chunk)
+            if digest != info['sha256']:
+                problems.append(f"{table}: database has {count} rows, export {info['rows']} (checksum mismatch)")
+            else:
+                log(f"✅ {table}: {count} rows match")
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    return problems
@@ -0,0 +1,390 @@
+"""
+Vote recording and aggregation helpers.
+
+Every vote write also maintains ``vote_buckets``: per-submission vote totals
+bucketed by the UTC epoch hour the vote was cast. Trending over any window is then
+a sum over a few hourly buckets instead of a scan of ``message_votes``.
+
+When a submission's voting window closes its votes are settled once:
+:func:`settle_closed` walks ``submission_index`` in close order past a
+watermark kept in ``meta``, stores each message's final tally in
+``vote_results`` and credits the vote points to ``rankings``, a batch of
+messages per transaction.
+
+Reaction votes go through :class:`VoteQueue`, which coalesces add/remove
+events per (message, voter) in memory and writes them in one transaction
+per flush. :func:`reconcile` repairs what the event stream missed (reactions
+added while the bot was offline): it fetches the reaction users of every
+submission still open for voting and applies the set difference against
+stored quick votes, checkpointing its position in ``meta``. Each
+``message_votes`` row records its ``source``: only rows written from
+reactions are ever removed or reconciled, so a graded ``!vote 1`` stays put.
+
+The write helpers take a sqlite3 connection and are meant to run inside
+``Database.transaction``.
+"""
+
+import asyncio
+import json
+
+from .db import get_meta, now_ms, set_meta
+from .leaderboard import VOTE_POINTS, add_points
+
+# meta key: [timestamp, message_id] of the last settled submission_index entry
+SETTLE_WATERMARK = 'vote_settle_mark'
+# meta key: [timestamp, message_id] reached by the current reconcile pass
+RECONCILE_MARK = 'vote_reconcile_mark'
+
+# message_votes.source values
+SOURCE_COMMAND = 'command'
+SOURCE_REACTION = 'reaction'
+
+
+def hour_of(ts: int) -> int:
+    """Return the UTC epoch hour of an epoch-millisecond timestamp."""
+    return ts // 3600000
+
+
+def _bump(conn, message_id: int, hour: int, score: int, votes: int):
+    conn.execute(
+        "INSERT INTO vote_buckets(hour, message_id, total, votes) VALUES(?,?,?,?) "
+        "ON CONFLICT(hour, message_id) DO UPDATE SET "
+        "total = total + excluded.total, votes = votes + excluded.votes",
+        (hour, message_id, score, votes),
+    )
+
+
+def add_vote(conn, message_id: int, voter_id: int, score: int, ts: int,
+             source: str = SOURCE_COMMAND):
+    """Record a vote; raises sqlite3.IntegrityError if the user already voted."""
+    conn.execute(
+        "INSERT INTO message_votes(message_id, voter_id, score, ts, source) VALUES(?,?,?,?,?)",
+        (message_id, voter_id, score, ts, source),
+    )
+    _bump(conn, message_id, hour_of(ts), score, 1)
+
+
+def remove_vote(conn, message_id: int, voter_id: int, score: int = None) -> bool:
+    """Delete a user's vote (optionally only one with ``score``); return True if one was removed."""
+    sql = "SELECT score, ts FROM message_votes WHERE message_id = ? AND voter_id = ?"
+    params = [message_id, voter_id]
+    if score is not None:
+        sql += " AND score = ?"
+        params.append(score)
+    row = conn.execute(sql, params).fetchone()
+    if not row:
+        return False
+    old_score, ts = row
+    conn.execute(
+        "DELETE FROM message_votes WHERE message_id = ? AND voter_id = ?",
+        (message_id, voter_id),
+    )
+    _bump(conn, message_id, hour_of(ts), -old_score, -1)
+    return True
+
+
+def apply_reactions(conn, changes):
+    """Apply coalesced quick-vote (score 1) changes in one pass.
+
+    ``changes`` holds ``(message_id, voter_id, ts)`` tuples; ``ts`` is the epoch
+    ms of the reaction for an add and None for a remove. Adds never replace an
+    existing vote and removes only delete votes that came from a reaction.
+    Returns ``(added, removed)``.
+    """
+    buckets, added, removed = {}, 0, 0
+    for message_id, voter_id, ts in changes:
+        if ts is not None:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO message_votes(message_id, voter_id, score, ts, source) "
+                "VALUES(?,?,1,?,?)",
+                (message_id, voter_id, ts, SOURCE_REACTION),
+            )
+            if not cur.rowcount:
+                continue
+            key, delta = (hour_of(ts), message_id), 1
+            added += 1
+        else:
+            row = conn.execute(
+                "SELECT ts FROM message_votes WHERE message_id = ? AND voter_id = ? AND source = ?",
+                (message_id, voter_id, SOURCE_REACTION),
+            ).fetchone()
+            if not row:
+                continue
+            conn.execute(
+                "DELETE FROM message_votes WHERE message_id = ? AND voter_id = ?",
+                (message_id, voter_id),
+            )
+            key, delta = (hour_of(row[0]), message_id), -1
+            removed += 1
+        buckets[key] = buckets.get(key, 0) + delta
+    conn.executemany(
+        "INSERT INTO vote_buckets(hour, message_id, total, votes) VALUES(?,?,?,?) "
+        "ON CONFLICT(hour, message_id) DO UPDATE SET "
+        "total = total + excluded.total, votes = votes + excluded.votes",
+        [(hour, mid, delta, delta) for (hour, mid), delta in buckets.items() if delta],
+    )
+    return added, removed
+
+
+class VoteQueue:
+    """Write-behind queue for reaction votes.
+
+    Events are keyed by ``(message_id, voter_id)`` and the latest one wins, so
+    an add and a remove by the same user between flushes collapse into a
+    single change. ``flush`` writes everything pending in one transaction;
+    call it on a timer, before settling closed windows and on shutdown.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        # (message_id, voter_id) -> reaction ts (epoch ms) for an add, None for a remove
+        self._pending = {}
+        # Created on first flush, inside the running loop (3.9 binds locks at creation)
+        self._lock = None
+        self.flushes = 0
+
+    def add(self, message_id: int, voter_id: int, ts: int):
+        self._pending[(message_id, voter_id)] = ts
+
+    def remove(self, message_id: int, voter_id: int):
+        self._pending[(message_id, voter_id)] = None
+
+    def keys(self) -> set:
+        """``(message_id, voter_id)`` pairs with an unflushed change."""
+        return set(self._pending)
+
+    @property
+    def pending(self) -> int:
+        """Number of coalesced vote changes waiting to be written."""
+        return len(self._pending)
+
+    async def flush(self):
+        """Persist pending changes in one transaction; return ``(added, removed)``."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._pending:
+                return 0, 0
+            batch, self._pending = self._pending, {}
+            try:
+                result = await self.db.transaction(
+                    apply_reactions, [(mid, uid, ts) for (mid, uid), ts in batch.items()]
+                )
+            except Exception:
+                # Requeue for the next flush; events that arrived meanwhile are newer and win
+                for key, ts in batch.items():
+                    self._pending.setdefault(key, ts)
+                raise
+            self.flushes += 1
+            return result
+
+
+# Open submission messages past the reconcile mark with the channel each one
+# lives in: voting-hall posts are in the hall, anything else in the channel
+# recorded for it (raw messages, cached media). Only entries in a quick-vote
+# channel are returned; ``!submit`` command messages elsewhere never carry votes.
+_CHANNEL_OF = """CASE WHEN COALESCE(a.message_id, l.message_id) = si.message_id THEN :hall
+            ELSE COALESCE(m.channel_id, sm.channel_id) END"""
+_OPEN_BATCH = f"""
+SELECT si.message_id, si.timestamp, {_CHANNEL_OF}
+FROM submission_index si
+LEFT JOIN audio_submissions a ON si.kind = 'audio' AND a.id = si.submission_id
+LEFT JOIN link_submissions l ON si.kind = 'link' AND l.id = si.submission_id
+LEFT JOIN messages m ON si.kind = 'message' AND m.message_id = si.message_id
+LEFT JOIN submission_media sm ON sm.message_id = si.message_id
+WHERE (si.timestamp, si.message_id) > (:ts, :mid) AND {_CHANNEL_OF} IN ({{channels}})
+ORDER BY si.timestamp, si.message_id
+LIMIT :limit
+"""
+
+
+def _open_batch(conn, opened_after: int, batch_size: int, hall_channel_id: int, channels):
+    mark = json.loads(get_meta(conn, RECONCILE_MARK, 'null') or 'null') or [opened_after, 0]
+    # A mark older than the window means the pass fell behind; start at the window edge
+    if mark[0] < opened_after:
+        mark = [opened_after, 0]
+    channels = {f"c{i}": cid for i, cid in enumerate(channels)}
+    sql = _OPEN_BATCH.format(channels=', '.join(f":{key}" for key in channels))
+    return conn.execute(
+        sql, {'hall': hall_channel_id, 'ts': mark[0], 'mid': mark[1], 'limit': batch_size, **channels}
+    ).fetchall()
+
+
+def _sync_batch(conn, fetched, fetched_at: int, skip, mark, done: bool):
+    """Diff fetched reaction voters against stored reaction votes and apply the changes."""
+    changes = []
+    for message_id, voters in fetched:
+        # Settled results are final
+        if conn.execute("SELECT 1 FROM vote_results WHERE message_id = ?", (message_id,)).fetchone():
+            continue
+        # Votes written after the fetch may not be in ``voters`` yet; leave them alone
+        stored = {
+            row[0] for row in conn.execute(
+                "SELECT voter_id FROM message_votes WHERE message_id = ? AND source = ? AND ts < ?",
+                (message_id, SOURCE_REACTION, fetched_at),
+            )
+        }
+        changes += [(message_id, uid, fetched_at) for uid in voters - stored
+                    if (message_id, uid) not in skip]
+        changes += [(message_id, uid, None) for uid in stored - voters
+                    if (message_id, uid) not in skip]
+    added, removed = apply_reactions(conn, changes)
+    set_meta(conn, RECONCILE_MARK, 'null' if done else json.dumps(mark))
+    return added, removed
+
+
+async def reconcile(db, fetch_voters, window_hours: float, hall_channel_id: int, channels,
+                    concurrency: int = 4, batch_size: int = 50, queue: VoteQueue = None):
+    """Sync stored reaction votes with the reactions actually on open submissions.
+
+    Only submission messages in ``channels`` (the quick-vote channels, with
+    voting-hall posts resolved to ``hall_channel_id``) are checked.
+    ``fetch_voters(message_id, channel_id)`` is a coroutine returning the set of
+    user ids currently reacting with a quick-vote emoji, or None if the message
+    could not be fetched (it is then skipped). At most ``concurrency`` fetches
+    run at once. Each batch is applied in one transaction together with the
+    checkpoint, so an interrupted pass resumes after the last applied batch.
+    Changes still waiting in ``queue`` are newer than the fetch and win.
+    Returns ``(messages, added, removed)``.
+    """
+    opened_after = now_ms() - int(window_hours * 3600 * 1000)
+    sem = asyncio.Semaphore(concurrency)
+
+    async def fetch(message_id, channel_id):
+        async with sem:
+            return message_id, await fetch_voters(message_id, channel_id)
+
+    messages = added = removed = 0
+    while True:
+        rows = await db.read(_open_batch, opened_after, batch_size, hall_channel_id, channels)
+        fetched_at = now_ms()
+        results = await asyncio.gather(*(fetch(mid, cid) for mid, _, cid in rows))
+        fetched = [(mid, voters) for mid, voters in results if voters is not None]
+        done = len(rows) < batch_size
+        mark = [rows[-1][1], rows[-1][0]] if rows else None
+        skip = queue.keys() if queue else set()
+        a, r = await db.transaction(_sync_batch, fetched, fetched_at, skip, mark, done)
+        messages += len(fetched)
+        added += a
+        removed += r
+        if done:
+            return messages, added, removed
+
+
+def summary_embeds(rows, media, guild_id, hall_channel_id):
+    """Discord embed dicts for :func:`trending` rows, built from cached ``submission_media``.
+
+    Images are shown inline; anything else links to its submission message.
+    """
+    embeds = []
+    for i, (msg_id, total, channel_id) in enumerate(rows, start=1):
+        embed = {
+            'title': f"🏅 Trending #{i}",
+            # Discord's green/red
+            'color': 0x2ecc71 if total > 0 else 0xe74c3c,
+            'fields': [{'name': "Total Votes", 'value': str(total), 'inline': True}],
+        }
+        _, jump_url, url, content_type, _, _ = media.get(msg_id) or (None,) * 6
+        if url and (content_type or '').startswith('image/'):
+            embed['image'] = {'url': url}
+        else:
+            jump_url = jump_url or (
+                f"https://discord.com/channels/{guild_id}/{channel_id or hall_channel_id}/{msg_id}"
+            )
+            embed['fields'].append(
+                {'name': "Link", 'value': f"[View Submission]({jump_url})", 'inline': True}
+            )
+        embeds.append(embed)
+    return embeds
+
+
+def _trending(conn, since_hour: int, limit: int):
+    return conn.execute(
+        "SELECT b.message_id, SUM(b.total) AS total, m.channel_id FROM vote_buckets b "
+        "LEFT JOIN messages m ON m.message_id = b.message_id "
+        "WHERE b.hour >= ? GROUP BY b.message_id HAVING SUM(b.votes) > 0 "
+        "ORDER BY total DESC LIMIT ?",
+        (since_hour, limit),
+    ).fetchall()
+
+
+async def trending(db, hours: int, limit: int = 5):
+    """Top submissions by vote total over the last ``hours`` hours.
+
+    Returns ``(message_id, total, channel_id)`` rows; ``channel_id`` is only set
+    for raw submissions-channel messages (otherwise the voting hall).
+    """
+    return await db.read(_trending, hour_of(now_ms()) - hours, limit)
+
+
+# One row per closed submission message, resolved to its submission. Positive
+# votes from anyone but the author count towards points; ``total`` is the
+# plain score sum shown in summaries.
+_CLOSED_BATCH = """
+SELECT si.message_id, si.timestamp,
+       CASE WHEN ao.id IS NOT NULL THEN 'audio' ELSE si.kind END,
+       COALESCE(ao.id, si.submission_id),
+       COALESCE(a.user_id, l.user_id, m.author_id),
+       COALESCE(a.message_id, l.message_id, ao.message_id, si.message_id),
+       CASE WHEN ao.message_id IS NULL THEN m.channel_id END,
+       (SELECT COUNT(*) FROM message_votes v WHERE v.message_id = si.message_id
+            AND v.score > 0 AND v.voter_id IS NOT COALESCE(a.user_id, l.user_id, m.author_id)),
+       (SELECT COALESCE(SUM(v.score), 0) FROM message_votes v WHERE v.message_id = si.message_id)
+FROM submission_index si
+LEFT JOIN audio_submissions a ON si.kind = 'audio' AND a.id = si.submission_id
+LEFT JOIN link_submissions l ON si.kind = 'link' AND l.id = si.submission_id
+LEFT JOIN messages m ON si.kind = 'message' AND m.message_id = si.submission_id
+-- A raw submissions-channel post is usually also an audio submission
+LEFT JOIN audio_submissions ao ON si.kind = 'message' AND ao.orig_message_id = si.message_id
+WHERE (si.timestamp, si.message_id) > (?, ?) AND si.timestamp <= ?
+ORDER BY si.timestamp, si.message_id
+LIMIT ?
+"""
+
+
+def _settle_batch(conn, closed_before: int, batch_size: int, closed_at: int):
+    mark = json.loads(get_meta(conn, SETTLE_WATERMARK, '[0, 0]'))
+    rows = conn.execute(_CLOSED_BATCH, (*mark, closed_before, batch_size)).fetchall()
+    if not rows:
+        return None
+    conn.executemany(
+        "INSERT OR IGNORE INTO vote_results"
+        "(message_id, kind, submission_id, author_id, votes, total, closed_at) "
+        "VALUES(?,?,?,?,?,?,?)",
+        [(mid, kind, sub_id, author, n, total, closed_at)
+         for mid, _, kind, sub_id, author, _, _, n, total in rows],
+    )
+    credits = {}
+    for row in rows:
+        author, n = row[4], row[7]
+        if author is not None and n:
+            credits[author] = credits.get(author, 0) + n * VOTE_POINTS
+    totals = {uid: add_points(conn, uid, pts) for uid, pts in credits.items()}
+    set_meta(conn, SETTLE_WATERMARK, json.dumps([rows[-1][1], rows[-1][0]]))
+    return rows, totals
+
+
+async def settle_closed(db, window_hours: float, now: int = None, batch_size: int = 500):
+    """Settle every submission message whose voting window has closed.
+
+    Returns ``(results, totals)``: one ``(kind, submission_id, author_id,
+    hall_message_id, channel_id, votes, total)`` tuple per settled submission
+    (its messages summed) and the new rankings total of each credited user.
+    """
+    now = now_ms() if now is None else now
+    closed_before = now - int(window_hours * 3600 * 1000)
+    by_sub, totals = {}, {}
+    while True:
+        done = await db.transaction(_settle_batch, closed_before, batch_size, now)
+        if not done:
+            break
+        rows, batch_totals = done
+        totals.update(batch_totals)
+        for _, _, kind, sub_id, author, hall_id, channel_id, n, total in rows:
+            entry = by_sub.setdefault((kind, sub_id), [author, hall_id, channel_id, 0, 0])
+            entry[3] += n
+            entry[4] += total
+        if len(rows) < batch_size:
+            break
+    results = [(kind, sub_id, *entry) for (kind, sub_id), entry in by_sub.items()]
+    return results, totals
@@ -0,0 +1,270 @@
+"""
+XP accrual helpers.
+
+Message XP is accumulated in memory and written behind in batches: awards for
+the same user coalesce into a single ``users`` upsert and all pending
+``xp_events`` rows go out in one transaction per flush. The same bounded LRU
+of user state answers "was this user awarded XP in the last minute?" without SQL.
+
+Raw ``xp_events`` are periodically rolled up into per-user daily totals
+(``xp_daily``) and pruned past a retention window, so history queries read a
+handful of rollup rows instead of every event.
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from .db import AUTO_VACUUM_INCREMENTAL, get_meta, set_meta, to_ms
+
+# Minimum seconds between two XP awards for the same user
+XP_COOLDOWN_SECONDS = 60
+# meta key: highest xp_events.id already folded into xp_daily
+ROLLUP_WATERMARK = 'xp_rollup_last_id'
+
+
+def level_for(xp: int) -> int:
+    """Return the level reached with ``xp`` experience points."""
+    return int(0.1 * math.sqrt(xp))
+
+
+class XPAccumulator:
+    """Write-behind buffer for XP awards.
+
+    ``award`` updates the in-memory user state immediately (so level-ups can be
+    acted on right away) and queues the DB writes; ``flush`` persists everything
+    pending in a single transaction. Call ``flush`` on a timer and on shutdown.
+
+    User state and the cooldown live in one LRU map of at most ``max_users``
+    entries, so ``on_message`` rejects messages inside the cooldown without any
+    SQL. Only flushed users are evicted; an evicted user simply falls through to
+    the slower path, which still enforces the cooldown from ``last_xp_ts``.
+    """
+
+    def __init__(self, db, max_events: int = 500, max_users: int = 50000):
+        self.db = db
+        self.max_events = max_events
+        self.max_users = max_users
+        # user_id -> [xp, level, last_xp_ts (epoch ms or None), monotonic time of last award or None]
+        self._users = OrderedDict()
+        self._dirty = set()
+        # Users whose write is in flight; their stored row may still be stale
+        self._flushing = set()
+        self._events = []
+        # Created on first flush, inside the running loop (3.9 binds locks at creation)
+        self._lock = None
+        self._flush_task = None
+        self.flushes = 0
+
+    def __len__(self):
+        return len(self._users)
+
+    def _evict(self, keep: int = None):
+        """Drop least recently used flushed users (never ``keep``) while over ``max_users``."""
+        excess = len(self._users) - self.max_users
+        if excess <= 0:
+            return
+        victims = []
+        # Unflushed users were touched recently, so this stops near the LRU end
+        for uid in self._users:
+            if uid != keep and uid not in self._dirty and uid not in self._flushing:
+                victims.append(uid)
+                if len(victims) == excess:
+                    break
+        for uid in victims:
+            del self._users[uid]
+
+    def _put(self, user_id: int, state):
+        self._users[user_id] = state
+        self._evict(keep=user_id)
+
+    async def _state(self, user_id: int):
+        state = self._users.get(user_id)
+        if state is None:
+            row = await self.db.fetchone(
+                "SELECT xp, level, last_xp_ts FROM users WHERE user_id = ?", (user_id,)
+            )
+            # Another award for this user may have landed while we were reading
+            state = self._users.get(user_id)
+            if state is None:
+                state = [*row, None] if row else [0, 0, None, None]
+                self._put(user_id, state)
+        self._users.move_to_end(user_id)
+        return state
+
+    def cooling_down(self, user_id: int, mono: float = None) -> bool:
+        """Return True if ``user_id`` was awarded XP less than the cooldown ago (no SQL)."""
+        state = self._users.get(user_id)
+        if state is None or state[3] is None:
+            return False
+        return (time.monotonic() if mono is None else mono) - state[3] < XP_COOLDOWN_SECONDS
+
+    async def warm_cooldowns(self, now: int):
+        """Load users awarded XP within the last cooldown window (``now`` in epoch ms)."""
+        rows = await self.db.fetchall(
+            "SELECT user_id, xp, level, last_xp_ts FROM users WHERE last_xp_ts >= ? "
+            "ORDER BY last_xp_ts DESC LIMIT ?",
+            (now - XP_COOLDOWN_SECONDS * 1000, self.max_users),
+        )
+        mono = time.monotonic()
+        # Oldest first so the most recent end up most recently used
+        for user_id, xp, lvl, last_ts in reversed(rows):
+            # Never overwrite fresher in-memory awards (e.g. on a reconnect)
+            if user_id not in self._users:
+                self._put(user_id, [xp, lvl, last_ts, mono - (now - last_ts) / 1000])
+        return len(rows)
+
+    async def stats(self, user_id):
+        """Return ``(xp, level)`` for a user, including unflushed awards."""
+        xp, lvl, _, _ = await self._state(int(user_id))
+        return xp, lvl
+
+    async def award(self, user_id: int, now: int, delta: int = 1, reason: str = "message"):
+        """Award XP if the user is off cooldown (``now`` in epoch ms).
+
+        Returns ``(old_level, new_level)`` when XP was awarded, otherwise None.
+        """
+        mono = time.monotonic()
+        if self.cooling_down(user_id, mono):
+            self._users.move_to_end(user_id)
+            return None
+        state = await self._state(user_id)
+        xp, lvl, last_ts, _ = state
+        if last_ts and now - last_ts < XP_COOLDOWN_SECONDS * 1000:
+            return None
+        new_xp = xp + delta
+        new_lvl = level_for(new_xp)
+        state[:] = [new_xp, new_lvl, now, mono]
+        self._dirty.add(user_id)
+        self._events.append((user_id, delta, reason, now))
+        if len(self._events) >= self.max_events and not (self._flush_task and not self._flush_task.done()):
+            self._flush_task = asyncio.ensure_future(self.flush())
+        return lvl, new_lvl
+
+    @property
+    def pending(self) -> int:
+        """Number of XP events waiting to be written."""
+        return len(self._events)
+
+    async def flush(self):
+        """Persist all pending awards and events in one transaction."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._events and not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, set()
+            self._flushing = dirty
+            events, self._events = self._events, []
+            users = [(uid, *self._users[uid][:3]) for uid in dirty if uid in self._users]
+
+            def _write(conn):
+                conn.executemany(
+                    "INSERT INTO users(user_id, xp, level, last_xp_ts) VALUES(?,?,?,?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET xp=excluded.xp, level=excluded.level, last_xp_ts=excluded.last_xp_ts",
+                    users,
+                )
+                conn.executemany(
+                    "INSERT INTO xp_events(user_id, delta, reason, ts) VALUES(?,?,?,?)",
+                    events,
+                )
+
+            try:
+                await self.db.transaction(_write)
+            except Exception:
+                # Put the batch back so the next flush retries it
+                self._dirty |= dirty
+                self._events[:0] = events
+                raise
+            finally:
+                self._flushing = set()
+            # Entries held past the bound while dirty can go now
+            self._evict()
+            self.flushes += 1
+            return len(events)
+
+
+def _rollup_batch(conn, batch_size: int) -> int:
+    last = int(get_meta(conn, ROLLUP_WATERMARK, 0))
+    count, upto = conn.execute(
+        "SELECT COUNT(*), MAX(id) FROM "
+        "(SELECT id FROM xp_events WHERE id > ? ORDER BY id LIMIT ?)",
+        (last, batch_size),
+    ).fetchone()
+    if not count:
+        return 0
+    conn.execute(
+        "INSERT INTO xp_daily(user_id, day, xp, events) "
+        "SELECT user_id, date(ts / 1000, 'unixepoch') AS day, SUM(delta), COUNT(*) FROM xp_events "
+        "WHERE id > ? AND id <= ? GROUP BY user_id, day "
+        "ON CONFLICT(user_id, day) DO UPDATE SET "
+        "xp = xp + excluded.xp, events = events + excluded.events",
+        (last, upto),
+    )
+    set_meta(conn, ROLLUP_WATERMARK, upto)
+    return count
+
+
+def _prune_batch(conn, cutoff: int, batch_size: int) -> int:
+    # Only rows already folded into xp_daily may go
+    last = int(get_meta(conn, ROLLUP_WATERMARK, 0))
+    return conn.execute(
+        "DELETE FROM xp_events WHERE id IN "
+        "(SELECT id FROM xp_events WHERE id <= ? AND ts < ? ORDER BY id LIMIT ?)",
+        (last, cutoff, batch_size),
+    ).rowcount
+
+
+def _incremental_vacuum(conn, pages: int):
+    # Never converts the file here: that is a full VACUUM, run offline with
+    # ``dbtool.py vacuum``; until then freed pages are simply reused
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+async def compact_xp_events(db, retention_days: int, batch_size: int = 5000, vacuum_pages: int = 2000):
+    """Roll xp_events into xp_daily, prune raw rows older than the retention and reclaim pages.
+
+    Pages are only returned to the OS once the file uses incremental
+    auto-vacuum (new databases do; see :func:`utils.db.enable_incremental_vacuum`).
+
+    Work is split into small transactions so other writes interleave on the
+    writer thread. Returns ``(rolled, pruned, free_pages)``.
+    """
+    rolled = pruned = 0
+    while True:
+        n = await db.transaction(_rollup_batch, batch_size)
+        if not n:
+            break
+        rolled += n
+    cutoff = to_ms(datetime.now(timezone.utc) - timedelta(days=retention_days))
+    while True:
+        n = await db.transaction(_prune_batch, cutoff, batch_size)
+        if not n:
+            break
+        pruned += n
+    free_pages = await db.transaction(_incremental_vacuum, vacuum_pages)
+    return rolled, pruned, free_pages
+
+
+def _xp_since(conn, user_id: int, since: datetime) -> int:
+    day = since.date()
+    rolled = conn.execute(
+        "SELECT COALESCE(SUM(xp), 0) FROM xp_daily WHERE user_id = ? AND day >= ?",
+        (user_id, day.isoformat()),
+    ).fetchone()[0]
+    # Plus the small tail of raw events not yet rolled up
+    last = int(get_meta(conn, ROLLUP_WATERMARK, 0))
+    raw = conn.execute(
+        "SELECT COALESCE(SUM(delta), 0) FROM xp_events WHERE id > ? AND user_id = ? AND ts >= ?",
+        (last, user_id, to_ms(datetime(day.year, day.month, day.day, tzinfo=timezone.utc))),
+    ).fetchone()[0]
+    return rolled + raw
+
+
+async def xp_since(db, user_id: int, since: datetime) -> int:
+    """XP a user gained since the start of ``since``'s (UTC) day, answered from the rollups."""
+    return await db.read(_xp_since, int(user_id), since)